@@ -7,6 +7,12 @@
     """
 
 import re
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 resetfg = '\033[38;0;39m'
 
@@ -67,17 +73,13 @@ def _parsehex(hexstring):
     b = hex2rgb(hexstring[5:7])
     return r, g, b
 
+_hexrx = re.compile('#[0-9A-Fa-f]{6}')
+
 def _validhex(hexstring):
     """_validhex(hexstring)
     validate a string as being a hex color value
     """
-    if  len(hexstring) == 7 and hexstring[0] == '#' and \
-        re.match('[0-9A-Fa-f]', hexstring[1]) and \
-        re.match('[0-9A-Fa-f]', hexstring[2]) and \
-        re.match('[0-9A-Fa-f]', hexstring[3]) and \
-        re.match('[0-9A-Fa-f]', hexstring[4]) and \
-        re.match('[0-9A-Fa-f]', hexstring[5]) and \
-        re.match('[0-9A-Fa-f]', hexstring[6]):
+    if isinstance(hexstring, str) and _hexrx.fullmatch(hexstring):
         return True
     else:
         return False
@@ -134,6 +136,26 @@ def guess256id(r, g, b):
     a 24 bit color using the 256 terminal preset colors,
     which is giving better results than anything else,
     so far. I don't know why. I'm guessing it's luck
+    the nearest color by manhattan distance, lowest id on a tie,
+    only the few candidates for the color's cell are compared.
+    """
+    if not _validrgb(r, g, b):
+        return _scan256id(r, g, b)
+    if _cells == None:
+        _buildcells()
+    id = 'x'
+    diff = 765
+    for i, pr, pg, pb in _cells[(r >> 5) << 6 | (g >> 5) << 3 | b >> 5]:
+        this = abs(r - pr) + abs(g - pg) + abs(b - pb)
+        if this < diff:
+            id = i
+            diff = this
+    return id
+
+def _scan256id(r, g, b):
+    """_scan256id(r, g, b)
+    the original scan of every preset color, used for values
+    which aren't valid rgb ints
     """
     id = 'x'
     diff = 765
@@ -146,6 +168,56 @@ def guess256id(r, g, b):
             diff = this
     return id
 
+_cells = None
+
+def _buildcells():
+    """_buildcells()
+    split the rgb cube into 8x8x8 cells of 32 values a side and keep,
+    for each cell, the preset colors which could be nearest to some
+    color inside it: those whose smallest possible distance is no
+    more than the smallest largest possible distance of any preset.
+    anything else is strictly further away, so results are exact.
+    """
+    global _cells
+    near = [[0 if 32 * n <= v < 32 * n + 32 else min(abs(v - 32 * n), abs(v - 32 * n - 31))
+        for v in range(256)] for n in range(8)]
+    far = [[max(abs(v - 32 * n), abs(v - 32 * n - 31)) for v in range(256)] for n in range(8)]
+    presets = [(i, c['r'], c['g'], c['b']) for i, c in rgbvalues.items()]
+    cells = []
+    for nr in range(8):
+        for ng in range(8):
+            for nb in range(8):
+                fr, fg, fb = far[nr], far[ng], far[nb]
+                limit = min(fr[pr] + fg[pg] + fb[pb] for i, pr, pg, pb in presets)
+                lr, lg, lb = near[nr], near[ng], near[nb]
+                cells.append(tuple(p for p in presets if lr[p[1]] + lg[p[2]] + lb[p[3]] <= limit))
+    _cells = cells
+
+def guess256ids(colors):
+    """guess256ids(colors)
+    guess256id for many colors at once, e.g. a palette, gradient or
+    image. colors is a sequence of (r, g, b) triples, returns a list
+    of ids. if numpy is installed and colors is an array of shape
+    (n, 3) the ids are computed as an array in one vectorised pass.
+    """
+    if numpy != None and isinstance(colors, numpy.ndarray):
+        presets = numpy.array([[c['r'], c['g'], c['b']] for c in rgbvalues.values()], dtype=numpy.int32)
+        ids = numpy.array(list(rgbvalues), dtype=numpy.int32)
+        colors = numpy.asarray(colors, dtype=numpy.int32).reshape(-1, 3)
+        out = numpy.empty(len(colors), dtype=numpy.int32)
+        for n in range(0, len(colors), 4096):
+            diff = numpy.abs(colors[n:n + 4096, None, :] - presets[None, :, :]).sum(axis=2)
+            out[n:n + 4096] = ids[diff.argmin(axis=1)]
+        return out
+    found = {}
+    out = []
+    for color in colors:
+        color = tuple(color)
+        if not color in found:
+            found[color] = guess256id(*color)
+        out.append(found[color])
+    return out
+
 def color16(string,color):
     """color16(string,colorstring)
     returns string wrapped in 16 color tags. Format tags
@@ -155,6 +227,121 @@ def color16(string,color):
     """
     return '\033[0;{}m{}{}'.format(color, string, fullreset)
 
+class Style:
+    """Style(*args, mode='trucolor')
+    a foreground color resolved once to its escape codes, so applying
+    it is just string concatenation. accepts the colors trucolor and
+    color256 do: a hex string, three ints for rgb, or with mode='256'
+    a 256 color name. mode='none' gives a style which adds nothing.
+    style(string) returns the string wrapped in the color tags, the
+    same as trucolor(string, *args) or color256(string, *args).
+    raises ValueError for a color which isn't valid.
+    """
+    __slots__ = ('prefix', 'suffix')
+
+    def __init__(self, *args, mode='trucolor'):
+        if mode == 'none':
+            self.prefix = self.suffix = ''
+            return
+        if len(args) == 1 and _validhex(args[0]):
+            r, g, b = _parsehex(args[0])
+        elif len(args) == 3 and _validrgb(args[0], args[1], args[2]):
+            r, g, b = args
+        elif mode == '256' and len(args) == 1 and args[0] in colornames:
+            r = g = b = None
+        else:
+            raise ValueError('invalid color: {}'.format(args))
+        if mode == 'trucolor':
+            self.prefix = '\033[38;2;{};{};{}m'.format(r, g, b)
+        elif mode == '256':
+            id = colornames[args[0]] if r == None else guess256id(r, g, b)
+            self.prefix = '\033[38;5;{}m'.format(id)
+        else:
+            raise ValueError('invalid mode: {}'.format(mode))
+        self.suffix = resetfg
+
+    def __call__(self, string):
+        return self.prefix + string + self.suffix
+
+class SpanWriter:
+    """SpanWriter(*streams, size=4096)
+    writes lines given as (style, text) spans, style being a Style or
+    None for plain text, with as few escape codes as it can: a color
+    is only sent when it changes, so adjacent spans of the same style
+    share one, and the foreground is only reset before plain text
+    which isn't whitespace. the text is gathered and written in
+    chunks of size pieces, straight to the binary buffer of a text
+    stream like sys.stdout when it has one. streams defaults to
+    sys.stdout. call flush() when done, or reset() first to leave
+    the terminal in its default color.
+    """
+
+    def __init__(self, *streams, size=4096):
+        self.streams = streams or (sys.stdout,)
+        self.size = size
+        self.parts = []
+        self.current = ''
+
+    def write(self, spans):
+        """write(spans)
+        add a sequence of (style, text) spans
+        """
+        parts = self.parts
+        current = self.current
+        for style, text in spans:
+            if not text:
+                continue
+            prefix = style.prefix if style else ''
+            if not prefix == current:
+                if prefix:
+                    parts.append(prefix)
+                    current = prefix
+                elif not text.isspace():
+                    parts.append(resetfg)
+                    current = ''
+            parts.append(text)
+        self.current = current
+        if len(parts) >= self.size:
+            self._send()
+
+    def raw(self, text):
+        """raw(text)
+        add text as it is, such as a newline or a background code,
+        it mustn't change the foreground color
+        """
+        self.parts.append(text)
+
+    def reset(self):
+        """reset()
+        go back to the default foreground color if another is set
+        """
+        if self.current:
+            self.parts.append(resetfg)
+            self.current = ''
+
+    def _send(self):
+        """_send()
+        write out what has been gathered
+        """
+        text = ''.join(self.parts)
+        self.parts = []
+        for stream in self.streams:
+            buffer = getattr(stream, 'buffer', None)
+            if buffer == None:
+                stream.write(text)
+            else:
+                # anything already written to the text layer goes first
+                stream.flush()
+                buffer.write(text.encode(stream.encoding or 'utf-8', stream.errors or 'strict'))
+
+    def flush(self):
+        """flush()
+        write out everything and flush the streams
+        """
+        self._send()
+        for stream in self.streams:
+            getattr(stream, 'buffer', stream).flush()
+
 colornames = {
     'Black': 0, 'Maroon': 1, 'Green': 2, 'Olive': 3, 'Navy': 4,
     'Purple': 129, 'Teal': 6, 'Silver': 7, 'Grey': 8, 'Red': 9,
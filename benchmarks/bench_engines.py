@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""bench_engines:
+    compares the throughput and accuracy of the modsearch parsing
+    engines on a synthetic corpus with a known list of symbols.
+    usage: python bench_engines.py [modules]
+    """
+
+import sys
+import re
+from time import perf_counter
+from bg.modsearch import parsetext, engines
+
+def makemodule(n):
+    """makemodule(int)
+    returns (text, expected) for a synthetic module, expected is a
+    list of (keyword, name, arglist, line, depth) tuples
+    """
+    out = []
+    expected = []
+
+    def add(text):
+        out.append(text)
+
+    def line():
+        return sum(t.count('\n') for t in out) + 1
+
+    expected.append(('def', 'plain{}'.format(n), '(a, b=1, *args, **kwargs)', line(), 0))
+    add('def plain{}(a, b=1, *args, **kwargs):\n    """a plain function"""\n    return a\n\n'.format(n))
+    add('@decorator(1)\n')
+    expected.append(('def', 'fetch{}'.format(n), '(url: str, timeout: float=(1, 2)) -> dict', line(), 0))
+    add('async def fetch{}(url: str, timeout: float = (1, 2)) -> dict:\n    """async with annotations"""\n    pass\n\n'.format(n))
+    expected.append(('def', 'multiline{}'.format(n), "(first, second=[1, 2], third={'k': 1}, *, fourth=None)", line(), 0))
+    add("def multiline{}(first,\n        second=[1, 2],\n        third={{'k': 1}},\n        *, fourth=None):\n"
+        '    """signature over several lines"""\n    return first\n\n'.format(n))
+    for c in range(5):
+        expected.append(('class', 'Thing{}_{}'.format(n, c), '(Base)', line(), 0))
+        add('class Thing{}_{}(Base):\n    """Thing heredoc\n\n    def looks_like_code(x):\n        pass\n    '.format(n, c)
+            + 'padding text ' * 40 + '\n    """\n\n')
+        for d in range(6):
+            expected.append(('def', 'method{}'.format(d), '(self, x=(1, 2), y=[3])', line(), 1))
+            add('    def method{}(self, x=(1, 2), y=[3]):\n        """method{} docs"""\n'
+                '        s = """not a docstring, def fake(): pass"""\n        return s\n\n'.format(d, d))
+    return ''.join(out), expected
+
+def score(found, expected):
+    """score(found, expected)
+    returns the fraction of expected symbols found by name and line,
+    and the fraction also found with the full signature and nesting
+    """
+    strip = lambda s: re.sub(r'\s', '', s)
+    names = set((k, n, l) for k, n, a, d, l, depth in found)
+    full = set((k, n, strip(a), l, depth) for k, n, a, d, l, depth in found)
+    hitnames = sum((k, n, l) in names for k, n, a, l, depth in expected)
+    hitfull = sum((k, n, strip(a), l, depth) in full for k, n, a, l, depth in expected)
+    return hitnames / len(expected), hitfull / len(expected)
+
+if __name__ == '__main__':
+    modules = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    corpus = [makemodule(n) for n in range(modules)]
+    size = sum(len(text) for text, expected in corpus) / 1e6
+    print('{} modules, {:.2f} MB'.format(modules, size))
+    for engine in engines:
+        start = perf_counter()
+        results = [parsetext(text, engine) for text, expected in corpus]
+        elapsed = perf_counter() - start
+        names = full = 0
+        for found, (text, expected) in zip(results, corpus):
+            a, b = score(found, expected)
+            names += a
+            full += b
+        print('{:10s} {:8.2f} MB/s   names {:6.1%}   signatures {:6.1%}'.format(
+            engine, size / elapsed, names / modules, full / modules))
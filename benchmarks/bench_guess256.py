@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""bench_guess256:
+    times the nearest 256 color lookup against the original scan of
+    every preset, and checks they agree.
+    usage: python bench_guess256.py [colors] [--exhaustive]
+    --exhaustive compares all 16777216 colors, which takes a while
+    """
+
+import sys
+import random
+from time import perf_counter
+from bg import ansi
+
+def exhaustive():
+    """exhaustive()
+    compare guess256id with a brute force over every rgb color. the
+    brute force takes, for each r and g, the best preset for every
+    distinct blue value, then sweeps b over those, keeping the lowest
+    id on a tie just like the original scan. returns the mismatches
+    """
+    presets = [(i, c['r'], c['g'], c['b']) for i, c in ansi.rgbvalues.items()]
+    blues = sorted(set(p[3] for p in presets))
+    mismatches = []
+    for r in range(256):
+        for g in range(256):
+            best = {}
+            for i, pr, pg, pb in presets:
+                d = (abs(r - pr) + abs(g - pg), i)
+                if not pb in best or d < best[pb]:
+                    best[pb] = d
+            for b in range(256):
+                expected = min((d + abs(b - v), i) for v, (d, i) in best.items())[1]
+                if not ansi.guess256id(r, g, b) == expected:
+                    mismatches.append((r, g, b))
+        print('r = {} done, {} mismatches'.format(r, len(mismatches)), file=sys.stderr)
+    return mismatches
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    count = int(args[0]) if args else 100000
+    random.seed(0)
+    colors = [(random.randrange(256), random.randrange(256), random.randrange(256)) for n in range(count)]
+    start = perf_counter()
+    expected = [ansi._scan256id(*c) for c in colors]
+    scan = perf_counter() - start
+    start = perf_counter()
+    found = [ansi.guess256id(*c) for c in colors]
+    lookup = perf_counter() - start
+    start = perf_counter()
+    batch = ansi.guess256ids(colors)
+    batchtime = perf_counter() - start
+    assert found == expected and list(batch) == expected, 'results differ from the original scan'
+    print('{} colors'.format(count))
+    print('scan       {:8.2f} us per color'.format(scan / count * 1e6))
+    print('guess256id {:8.2f} us per color'.format(lookup / count * 1e6))
+    print('batch      {:8.2f} us per color'.format(batchtime / count * 1e6))
+    if ansi.numpy != None:
+        array = ansi.numpy.array(colors)
+        start = perf_counter()
+        vectorised = ansi.guess256ids(array)
+        elapsed = perf_counter() - start
+        assert list(vectorised) == expected, 'numpy results differ from the original scan'
+        print('numpy      {:8.2f} us per color'.format(elapsed / count * 1e6))
+    if '--exhaustive' in sys.argv:
+        mismatches = exhaustive()
+        print('exhaustive: {} mismatches {}'.format(len(mismatches), mismatches[:10]))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""bench_phases:
+    times each phase of modsearch on its own over a synthetic corpus,
+    walk, parse for every engine, render for every colormode and
+    display flag combination, output to memory, /dev/null and a file,
+    and a whole run per colormode in a child process for its peak RSS.
+    results are printed, saved as JSON with --save and compared with
+    an earlier run with --baseline, which exits 1 on a regression.
+    usage: python bench_phases.py --help
+    """
+
+import sys
+import io
+import json
+import argparse
+import platform
+import resource
+import subprocess
+from os import devnull, pathsep, environ
+from os.path import join, getsize, isdir
+from itertools import product
+from tempfile import TemporaryDirectory
+from time import perf_counter, process_time
+from corpus import generate
+from bg.modsearch import walktree, parseall, engines, iter_modsearch, Renderer
+
+colormodes = ('none', '256', 'trucolor')
+flags = ('links', 'modified', 'classes', 'functions', 'docs')
+
+def timed(fn, repeat):
+    """timed(fn, repeat)
+    returns (seconds, cpu seconds, result) of the fastest of repeat calls
+    """
+    best = None
+    for n in range(repeat):
+        start, cpu = perf_counter(), process_time()
+        result = fn()
+        elapsed, cpu = perf_counter() - start, process_time() - cpu
+        if best == None or elapsed < best[0]:
+            best = (elapsed, cpu, result)
+    return best
+
+def label(options):
+    """label(options)
+    name of a display flag combination, e.g. links+docs
+    """
+    return '+'.join(f for f in flags if options[f]) or 'bare'
+
+def walkphase(path, repeat):
+    """walkphase(path, repeat)
+    directories and entries per second of walktree
+    """
+    def walk():
+        dirs = files = 0
+        for root, entries in walktree(path):
+            dirs += 1
+            files += len(entries)
+        return dirs, files
+    elapsed, cpu, (dirs, files) = timed(walk, repeat)
+    return {'walk': {'seconds': elapsed, 'cpu': cpu, 'dirs': dirs, 'entries': files,
+        'entries_per_sec': files / elapsed}}
+
+def parsephase(filepaths, repeat):
+    """parsephase(filepaths, repeat)
+    parseall in-process with each engine
+    """
+    size = sum(getsize(f) for f in filepaths)
+    results = {}
+    for engine in engines:
+        elapsed, cpu, found = timed(lambda: parseall(filepaths, engine=engine), repeat)
+        results['parse.' + engine] = {'seconds': elapsed, 'cpu': cpu,
+            'symbols': sum(len(symbols) for symbols in found),
+            'files_per_sec': len(filepaths) / elapsed, 'mb_per_sec': size / elapsed / 1e6}
+    return results
+
+def renderphase(records, repeat):
+    """renderphase(records, repeat)
+    Renderer.render for every colormode and display flag combination,
+    classes and functions are applied as the search would
+    """
+    results = {}
+    for colormode in colormodes:
+        for values in product((True, False), repeat=len(flags)):
+            options = dict(zip(flags, values))
+            kinds = {'dir', 'file'}
+            if options['classes']:
+                kinds.add('class')
+            if options['functions']:
+                kinds.add('def')
+            selected = [r for r in records if r.kind in kinds]
+            renderer = Renderer(options['links'], options['modified'], options['docs'], colormode)
+            def render():
+                lines = 0
+                for record in selected:
+                    lines += len(renderer.render(record))
+                return lines
+            elapsed, cpu, lines = timed(render, repeat)
+            results['render.{}.{}'.format(colormode, label(options))] = {'seconds': elapsed, 'cpu': cpu,
+                'lines': lines, 'lines_per_sec': lines / elapsed}
+    return results
+
+def outputphase(records, path, repeat):
+    """outputphase(records, path, repeat)
+    Renderer.emit to memory, to /dev/null and to /dev/null plus a file
+    """
+    renderer = Renderer(colormode='trucolor')
+    text = io.StringIO()
+    renderer.emit(records, [text])
+    size = len(text.getvalue().encode())
+    def memory():
+        renderer.emit(records, [io.StringIO()])
+    def null():
+        with open(devnull, 'wt') as out:
+            renderer.emit(records, [out])
+    def saveas():
+        with open(devnull, 'wt') as stdout, open(join(path, 'saveas.txt'), 'wt') as out:
+            renderer.emit(records, [stdout, out])
+    results = {}
+    for name, fn in (('memory', memory), ('devnull', null), ('saveas', saveas)):
+        elapsed, cpu, result = timed(fn, repeat)
+        results['output.' + name] = {'seconds': elapsed, 'cpu': cpu, 'mb_per_sec': size / elapsed / 1e6}
+    return results
+
+def endtoendphase(path, files):
+    """endtoendphase(path, files)
+    a whole modsearch run per colormode in a child process, the child
+    reports its own high water mark since ru_maxrss carries over fork
+    """
+    env = dict(environ, PYTHONPATH=pathsep.join(p for p in sys.path if p))
+    code = ('import sys, resource\nfrom bg.modsearch import modsearch\n'
+        'modsearch(sys.argv[1], colormode=sys.argv[2])\n'
+        'try:\n    peak = [l.split()[1] for l in open("/proc/self/status") if l.startswith("VmHWM")][0]\n'
+        'except (OSError, IndexError):\n    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n'
+        'sys.stderr.write(str(peak))')
+    results = {}
+    for colormode in colormodes:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = usage.ru_utime + usage.ru_stime
+        with open(devnull, 'wb') as out:
+            start = perf_counter()
+            child = subprocess.run([sys.executable, '-c', code, path, colormode], stdout=out,
+                stderr=subprocess.PIPE, env=env, check=True)
+            elapsed = perf_counter() - start
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        results['endtoend.' + colormode] = {'seconds': elapsed, 'cpu': usage.ru_utime + usage.ru_stime - cpu,
+            'files_per_sec': files / elapsed, 'peak_rss_kb': int(child.stderr.split()[-1])}
+    return results
+
+def run(path, filepaths, repeat):
+    """run(path, filepaths, repeat)
+    returns a dict of results for every phase
+    """
+    results = {}
+    results.update(walkphase(path, repeat))
+    results.update(parsephase(filepaths, repeat))
+    records = list(iter_modsearch(path))
+    with TemporaryDirectory() as scratch:
+        results.update(renderphase(records, repeat))
+        results.update(outputphase(records, scratch, repeat))
+    results.update(endtoendphase(path, len(filepaths)))
+    results['process'] = {'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    return results
+
+def compare(results, baseline, tolerance, mintime):
+    """compare(results, baseline, tolerance, mintime)
+    returns a list of (key, metric, old, new) that got worse by more
+    than tolerance, timings shorter than mintime are too noisy to judge
+    """
+    worse = []
+    for key, old in baseline.items():
+        new = results.get(key)
+        if new == None:
+            continue
+        if old.get('seconds', mintime) < mintime:
+            continue
+        for metric, value in old.items():
+            if not metric in new or not value:
+                continue
+            if metric.endswith('_per_sec') and new[metric] < value * (1 - tolerance):
+                worse.append((key, metric, value, new[metric]))
+            elif metric in ('seconds', 'peak_rss_kb') and new[metric] > value * (1 + tolerance):
+                worse.append((key, metric, value, new[metric]))
+    return worse
+
+def report(results):
+    """report(results)
+    print one line per result
+    """
+    for key, values in results.items():
+        print('{:44} {}'.format(key, '  '.join('{} {:.4g}'.format(k, v) for k, v in values.items())))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='time each phase of modsearch over a synthetic corpus')
+    parser.add_argument('--files', type=int, default=500, help='number of modules in the corpus')
+    parser.add_argument('--depth', type=int, default=3, help='directory levels in the corpus')
+    parser.add_argument('--size', type=int, default=4000, help='approximate bytes per module')
+    parser.add_argument('--docdensity', type=float, default=0.5, help='fraction of symbols with heredocs')
+    parser.add_argument('--pathological', type=float, default=0.05, help='fraction of awkward blocks, nested quotes etc')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='keep the fastest of this many runs')
+    parser.add_argument('--corpus', help='directory to keep the corpus in, reused if it exists')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed fraction worse than the baseline')
+    parser.add_argument('--mintime', type=float, default=0.01, help='skip comparing timings shorter than this')
+    args = parser.parse_args()
+    params = {'files': args.files, 'depth': args.depth, 'size': args.size, 'docdensity': args.docdensity,
+        'pathological': args.pathological, 'seed': args.seed}
+
+    with TemporaryDirectory() as scratch:
+        path = args.corpus or join(scratch, 'corpus')
+        reuse = isdir(path)
+        filepaths = generate(path, args.files, args.depth, args.size, args.docdensity, args.pathological,
+            args.seed) if not reuse else [join(root, e.name) for root, entries in walktree(path)
+            for e in entries if e.name.endswith('.py')]
+        results = run(path, filepaths, args.repeat)
+
+    report(results)
+    out = {'corpus': params, 'python': platform.python_version(), 'machine': platform.machine(),
+        'results': results}
+    if args.save:
+        with open(args.save, 'wt') as f:
+            json.dump(out, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('corpus') != params:
+            print('warning: baseline corpus differs:', baseline.get('corpus'))
+        worse = compare(results, baseline['results'], args.tolerance, args.mintime)
+        for key, metric, old, new in worse:
+            print('REGRESSION {} {}: {:.4g} -> {:.4g}'.format(key, metric, old, new))
+        if worse:
+            sys.exit(1)
+        print('no regressions against', args.baseline)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""bench_render:
+    per line cost of coloring output, calling trucolor and color256
+    for every line as modsearch used to, against a precompiled Style.
+    usage: python bench_render.py [lines]
+    """
+
+import sys
+from timeit import timeit
+from bg.ansi import trucolor, color256, Style
+
+if __name__ == '__main__':
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    text = 'parse_config(path, defaults=None)'
+    cases = [
+        ('trucolor', lambda s: trucolor(s, '#0086d2'), Style('#0086d2')),
+        ('256 hex', lambda s: color256(s, '#0086d2'), Style('#0086d2', mode='256')),
+        ('256 name', lambda s: color256(s, 'DeepSkyBlue3'), Style('DeepSkyBlue3', mode='256')),
+    ]
+    for name, before, after in cases:
+        assert before(text) == after(text), name
+        old = timeit(lambda: before(text), number=lines) / lines * 1e9
+        new = timeit(lambda: after(text), number=lines) / lines * 1e9
+        print('{:10s} per call {:9.0f} ns before  {:6.0f} ns after  {:6.1f}x'.format(name, old, new, old / new))
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""bench_workers:
+    times the parsing stage of modsearch over a synthetic tree
+    for an increasing number of worker processes.
+    usage: python bench_workers.py [files] [maxworkers]
+    """
+
+import sys
+from os import cpu_count
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from corpus import generate
+from bg.modsearch import parseall
+
+if __name__ == '__main__':
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    maxworkers = int(sys.argv[2]) if len(sys.argv) > 2 else cpu_count() or 1
+    with TemporaryDirectory() as path:
+        filepaths = generate(path, files, size=10000, docdensity=1.0, pathological=0)
+        expected = None
+        workers = 1
+        while True:
+            start = perf_counter()
+            result = parseall(filepaths, workers)
+            elapsed = perf_counter() - start
+            if expected == None:
+                expected, base = result, elapsed
+            assert result == expected, 'results differ from workers=1'
+            print('workers {:3d}  {:8.3f}s  {:6.2f}x  {:8.0f} files/s'.format(
+                workers, elapsed, base / elapsed, files / elapsed))
+            if workers >= maxworkers:
+                break
+            workers = min(workers * 2, maxworkers)
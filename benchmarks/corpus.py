@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""corpus:
+    writes a deterministic synthetic python tree for the benchmarks,
+    the same arguments always give the same directories and bytes.
+    usage: python corpus.py path [files] [depth] [size] [docdensity] [pathological]
+    """
+
+import sys
+import random
+from os import makedirs
+from os.path import join
+
+_words = ('parse', 'the', 'config', 'file', 'and', 'return', 'a', 'record', 'for', 'each',
+    'symbol', 'found', 'in', 'tree', 'path', 'index', 'value', 'of', 'name', 'list')
+
+def _docstring(rng, indent, words=12):
+    """_docstring(rng, indent, words=12)
+    returns a heredoc of a few lines at the given indent
+    """
+    lines = []
+    for n in range(rng.randint(1, 4)):
+        lines.append(' '.join(rng.choice(_words) for w in range(words)))
+    return indent + '"""' + ('\n' + indent).join(lines) + '\n' + indent + '"""\n'
+
+_pathological = (
+    # quotes inside ordinary strings
+    'QUOTES = \'"""\' + "\'\'\'"\n\n',
+    # code inside a docstring
+    'def decoy{n}():\n    """\n    def fake{n}(x):\n        pass\n    class Fake{n}:\n    """\n    return None\n\n',
+    # a module level string which isn't a docstring
+    'TEMPLATE{n} = """\nclass NotAClass{n}(object):\n    def not_a_method(self):\n"""\n\n',
+    # the other quote style inside a docstring
+    "def mixed{n}(a='\"\"\"', b=\"'''\"):\n    '''single quoted docstring with \"\"\" inside'''\n    return a\n\n",
+    # a signature over several lines
+    'def wrapped{n}(first,\n        second=(1, 2),\n        *args, **kwargs):\n    """wrapped signature"""\n    return first\n\n',
+    # a very long docstring
+    'def verbose{n}():\n    """' + 'a long heredoc line with nothing in it\n    ' * 200 + '"""\n    pass\n\n',
+    # docstring on the same line as the closing quotes
+    'class Tight{n}: """tight"""\n\n',
+)
+
+def makemodule(rng, size, docdensity, pathological):
+    """makemodule(rng, size, docdensity, pathological)
+    returns the text of one module of about size bytes, a docdensity
+    fraction of symbols have heredocs and a pathological fraction of
+    the blocks are awkward cases for the parsers
+    """
+    out = []
+    total = 0
+    n = 0
+    while total < size:
+        n += 1
+        if rng.random() < pathological:
+            block = rng.choice(_pathological).replace('{n}', str(n))
+        elif rng.random() < 0.3:
+            block = 'def function{}(a, b=1, *args, **kwargs):\n'.format(n)
+            if rng.random() < docdensity:
+                block += _docstring(rng, '    ')
+            block += '    return a + b\n\n'
+        else:
+            block = 'class Thing{}(object):\n'.format(n)
+            if rng.random() < docdensity:
+                block += _docstring(rng, '    ')
+            for m in range(rng.randint(1, 8)):
+                block += '    def method{}(self, x, y=None):\n'.format(m)
+                if rng.random() < docdensity:
+                    block += _docstring(rng, '        ')
+                block += '        return x\n\n'
+        out.append(block)
+        total += len(block)
+    return ''.join(out)
+
+def generate(path, files=500, depth=3, size=4000, docdensity=0.5, pathological=0.05, seed=0, fanout=3):
+    """generate(path, files=500, depth=3, size=4000, docdensity=0.5, pathological=0.05, seed=0, fanout=3)
+    write files modules under path in a tree depth levels deep with
+    fanout directories per level, returns the list of file paths
+    """
+    rng = random.Random(seed)
+    folders = [path]
+    level = [path]
+    for d in range(depth):
+        level = [join(parent, 'pkg{}'.format(i)) for parent in level for i in range(fanout)]
+        folders.extend(level)
+    for folder in folders:
+        makedirs(folder, exist_ok=True)
+    filepaths = []
+    for n in range(files):
+        filepaths.append(join(rng.choice(folders), 'mod{}.py'.format(n)))
+        with open(filepaths[-1], 'wt') as f:
+            f.write(makemodule(rng, size, docdensity, pathological))
+    return filepaths
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    args = sys.argv[2:]
+    files = generate(sys.argv[1],
+        int(args[0]) if len(args) > 0 else 500,
+        int(args[1]) if len(args) > 1 else 3,
+        int(args[2]) if len(args) > 2 else 4000,
+        float(args[3]) if len(args) > 3 else 0.5,
+        float(args[4]) if len(args) > 4 else 0.05)
+    print(len(files), 'files written to', sys.argv[1])
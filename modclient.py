@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""modclient:
+    thin client for the modsearch daemon (python modsearch.py --serve).
+    it only imports what it needs to talk to the socket, so a request
+    costs little more than interpreter startup. when no daemon is
+    running the search is done in-process with bg.modsearch instead.
+    results are tuples in the field order of modsearch Record and Hit.
+    """
+
+import sys
+import json
+import socket
+from os import getcwd
+from os.path import join, expanduser, abspath
+
+defaultsocket = join(expanduser('~'), '.cache', 'modsearch', 'modsearch.sock')
+
+def request(message, socketpath=None, timeout=None):
+    """request(message, socketpath=None, timeout=None)
+    send one request dict to the daemon and return the reply dict,
+    raises OSError if no daemon is listening
+    """
+    with socket.socket(socket.AF_UNIX) as s:
+        s.settimeout(timeout)
+        s.connect(expanduser(socketpath or defaultsocket))
+        s.sendall((json.dumps(message) + '\n').encode())
+        with s.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise OSError('the daemon closed the connection')
+    reply = json.loads(line)
+    if not reply.get('ok'):
+        raise RuntimeError(reply.get('error'))
+    return reply
+
+def _path(path):
+    """_path(path)
+    the daemon runs elsewhere, so send absolute paths
+    """
+    return abspath(expanduser(path)) if path else getcwd()
+
+def _local(options):
+    """_local(options)
+    the Watcher options without those only a watching daemon uses,
+    for searching in-process
+    """
+    return dict((k, v) for k, v in options.items() if not k in ('interval', 'settle', 'poll'))
+
+def records(path=None, socketpath=None, **options):
+    """records(path=None, socketpath=None, **options)
+    returns the Records of a tree as a list of tuples, options are
+    the modsearch Watcher options, interval, settle and poll are
+    ignored when searching in-process
+    """
+    try:
+        reply = request({'op': 'list', 'path': _path(path), 'options': options}, socketpath)
+    except OSError:
+        from bg.modsearch import iter_modsearch
+        return list(iter_modsearch(_path(path), **_local(options)))
+    return [tuple(r) for r in reply['records']]
+
+def query(text, path=None, kind=None, limit=20, socketpath=None, **options):
+    """query(text, path=None, kind=None, limit=20, socketpath=None, **options)
+    returns ranked Hits as a list of tuples, see modsearch.query,
+    options are those of records()
+    """
+    message = {'op': 'query', 'path': _path(path), 'text': text, 'kind': kind, 'limit': limit, 'options': options}
+    try:
+        reply = request(message, socketpath)
+    except OSError:
+        from bg.modsearch import query as localquery
+        return localquery(text, _path(path), kind, limit, **_local(options))
+    return [tuple(h) for h in reply['hits']]
+
+def running(socketpath=None):
+    """running(socketpath=None)
+    returns the daemon's ping reply, or None if it isn't running
+    """
+    try:
+        return request({'op': 'ping'}, socketpath, 1.0)
+    except OSError:
+        return None
+
+def stop(socketpath=None):
+    """stop(socketpath=None)
+    ask the daemon to shut down
+    """
+    request({'op': 'stop'}, socketpath, 1.0)
+
+if __name__ == '__main__':
+    usage = 'usage: modclient.py query TEXT [PATH] | list [PATH] | ping | stop'
+    args = sys.argv[1:]
+    if not args:
+        sys.exit(usage)
+    if args[0] == 'query' and len(args) > 1:
+        for score, kind, name, arglist, filepath, line in query(args[1], args[2] if len(args) > 2 else None):
+            print('{} {}{}  {}:{}'.format(kind, name, arglist, filepath, line))
+    elif args[0] == 'list':
+        for kind, filepath, name, arglist, heredoc, mtime, line, depth in records(args[1] if len(args) > 1 else None):
+            if kind == 'dir':
+                print(filepath)
+            elif kind == 'file':
+                print('    ' + name)
+            elif kind == 'error':
+                print('        Error: ' + heredoc)
+            else:
+                print('    ' * (2 + depth) + ('class ' if kind == 'class' else '') + name + arglist)
+    elif args[0] == 'ping':
+        print(running() or 'not running')
+    elif args[0] == 'stop':
+        stop()
+    else:
+        sys.exit(usage)
@@ -1,12 +1,2178 @@
-from os import walk, stat, getcwd, access, R_OK
-from time import ctime
+from os import scandir, stat, getcwd, access, makedirs, cpu_count, replace, fsencode, fsdecode, R_OK, O_CLOEXEC, sep
+from os import read as osread, close as osclose, getpid, unlink, fstat
+from time import ctime, sleep, monotonic, perf_counter, process_time, mktime
 import re
-from os.path import join, splitext, isdir, exists, expanduser, normpath
-from bg.ansi import trucolor, resetbg, color256
+import json
+import sqlite3
+from hashlib import sha1
+import sys
+import io
+import argparse
+import threading
+import queue
+import socket
+import socketserver
+import mmap
+import csv
+import zipfile
+import subprocess
+import ast
+import tokenize
+import keyword
+from fnmatch import fnmatchcase
+from bisect import bisect_left
+from heapq import heappush, heappushpop
+from math import log
+from datetime import datetime
+import struct
+import ctypes
+from ctypes.util import find_library
+from select import select
+from errno import ENOSPC
+from itertools import repeat, chain, islice
+from collections import namedtuple, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from os.path import join, splitext, isdir, isfile, exists, expanduser, normpath, dirname, basename, realpath, relpath
+from bg.ansi import Style, SpanWriter, resetbg
 
-def modsearch(path=None, links=True, modified=True, classes=True, functions=True, docs=True, saveas=None, colormode='trucolor', scheme='deepblue', skipdir=''):
+rx = re.compile('^\s*((def|class)\s*([a-zA-Z0-9_]+)\s*(\([a-zA-Z0-9_\,\ \=\'\"\*\.]*\))*):[\s]*(\"\"\"([\S\s]*?)\"\"\")*', re.MULTILINE)
+#rx = re.compile('^\s*((def|class)\s*(([^ (:]+)[\s]*([(][^:]+[\)])*)):[\s]*(\"\"\"([\S\s]*?)\"\"\")*', re.MULTILINE)
+
+Record = namedtuple('Record', 'kind path name arglist heredoc mtime line depth', defaults=(None, 0))
+Record.__doc__ = """Record(kind, path, name, arglist, heredoc, mtime, line=None, depth=0)
+one search result: kind is 'dir', 'file', 'class' or 'def',
+path is the directory or file path, mtime is only set for files,
+line and depth are the line number and nesting of classes and functions.
+kind 'error' follows a file which couldn't be searched, heredoc
+holds the reason. iter_modsearch(refs=True) adds kinds 'call',
+'attr', 'import' and 'name' for the names a file uses
+"""
+
+defaultindex = join(expanduser('~'), '.cache', 'modsearch', 'index.sqlite')
+
+defaultsocket = join(expanduser('~'), '.cache', 'modsearch', 'modsearch.sock')
+
+def _parseregex(t, spans=False):
+    """_parseregex(string, spans=False)
+    the original regular expression engine. quick on plain code but
+    misses multi-line or unusual arglists and cannot see nesting,
+    so depth is always 0
+    """
+    found = []
+    line, pos = 1, 0
+    for m in rx.finditer(t):
+        line += t.count('\n', pos, m.start(2))
+        pos = m.start(2)
+        if spans:
+            heredoc = (m.start(6), m.end(6), False) if not m.group(6) == None else None
+        else:
+            heredoc = m.group(6) or ''
+        found.append((m.group(2), m.group(3).strip(), (m.group(4) or '').strip(), heredoc, line, 0))
+    return found
+
+def _linestarts(t):
+    """_linestarts(string)
+    returns the offset of the start of each line
+    """
+    return [0] + [m.end() for m in re.finditer('\n', t)]
+
+def _parseast(t, spans=False):
+    """_parseast(string, spans=False)
+    extract classes and functions from the syntax tree, with full
+    signatures, async functions and nesting. falls back to the regex
+    engine for files which are not valid python 3
+    """
+    try:
+        tree = ast.parse(t)
+    except (SyntaxError, ValueError, RecursionError):
+        return _parseregex(t, spans)
+    found = []
+    starts = []
+
+    def heredoc(node):
+        """heredoc(node)
+        the docstring of node, or its span when spans is set,
+        ast columns count utf-8 bytes rather than characters
+        """
+        if not spans:
+            return ast.get_docstring(node, False) or ''
+        first = node.body[0] if node.body else None
+        if not (isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and \
+            isinstance(first.value.value, str)):
+            return None
+        if not starts:
+            starts.extend(_linestarts(t))
+        value = first.value
+        offsets = []
+        for line, col in ((value.lineno, value.col_offset), (value.end_lineno, value.end_col_offset)):
+            text = t[starts[line - 1]:starts[line - 1] + col]
+            if not text.isascii():
+                text = t[starts[line - 1]:starts[line] if line < len(starts) else len(t)]
+                text = text.encode()[:col].decode(errors='ignore')
+            offsets.append(starts[line - 1] + len(text))
+        return (offsets[0], offsets[1], True)
+
+    def visit(node, depth):
+        """visit(node, depth)
+        walk the statement lists of node, classes and functions
+        increase the depth of anything defined inside them
+        """
+        for field in ('body', 'handlers', 'orelse', 'finalbody', 'cases'):
+            for child in getattr(node, field, ()):
+                if isinstance(child, ast.ClassDef):
+                    bases = [ast.unparse(b) for b in child.bases + child.keywords]
+                    arglist = '(' + ', '.join(bases) + ')' if bases else ''
+                    found.append(('class', child.name, arglist, heredoc(child), child.lineno, depth))
+                    visit(child, depth + 1)
+                elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    arglist = '(' + ast.unparse(child.args) + ')'
+                    if child.returns:
+                        arglist += ' -> ' + ast.unparse(child.returns)
+                    found.append(('def', child.name, arglist, heredoc(child), child.lineno, depth))
+                    visit(child, depth + 1)
+                else:
+                    visit(child, depth)
+
+    try:
+        visit(tree, 0)
+    except RecursionError:
+        return _parseregex(t, spans)
+    return found
+
+def _literal(s):
+    """_literal(string)
+    returns the value of a string token, or '' if it isn't a plain str
+    """
+    try:
+        value = ast.literal_eval(s)
+    except (SyntaxError, ValueError):
+        return ''
+    return value if isinstance(value, str) else ''
+
+def _parsetokens(t, spans=False):
+    """_parsetokens(string, spans=False)
+    single pass scanner over the token stream, copes with multi-line
+    signatures, brackets in defaults, async and decorators without
+    building a syntax tree. falls back to the regex engine for files
+    which cannot be tokenized
+    """
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(t).readline))
+    except (tokenize.TokenError, SyntaxError):
+        return _parseregex(t, spans)
+    found = []
+    starts = _linestarts(t) if spans else None
+    scopes = []
+    indent = 0
+    first = True
+    i, n = 0, len(tokens)
+    while i < n:
+        tok = tokens[i]
+        i += 1
+        if tok.type == tokenize.INDENT:
+            indent += 1
+            continue
+        if tok.type == tokenize.DEDENT:
+            indent -= 1
+            while scopes and scopes[-1] >= indent:
+                scopes.pop()
+            continue
+        if tok.type in (tokenize.NEWLINE, tokenize.NL, tokenize.COMMENT):
+            first = first or tok.type == tokenize.NEWLINE
+            continue
+        if not first:
+            continue
+        first = tok.type == tokenize.NAME and tok.string == 'async'
+        if not (tok.type == tokenize.NAME and tok.string in ('def', 'class')) or \
+            i >= n or not tokens[i].type == tokenize.NAME:
+            continue
+        keyword, line, name = tok.string, tok.start[0], tokens[i].string
+        i += 1
+        # everything up to the ':' outside of brackets is the arglist
+        parts, prev, brackets = [], None, 0
+        while i < n:
+            tok = tokens[i]
+            if tok.type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+                break
+            i += 1
+            if tok.type in (tokenize.NL, tokenize.COMMENT):
+                continue
+            if tok.type == tokenize.OP:
+                if tok.string in ('(', '[', '{'):
+                    brackets += 1
+                elif tok.string in (')', ']', '}'):
+                    brackets -= 1
+                elif tok.string == ':' and brackets == 0:
+                    break
+            if prev and prev.end[0] == tok.start[0]:
+                parts.append(tok.line[prev.end[1]:tok.start[1]])
+            elif prev:
+                parts.append(' ')
+            parts.append(tok.string)
+            prev = tok
+        # a docstring is the first statement of the body
+        heredoc, block = None if spans else '', False
+        j = i
+        while j < n and tokens[j].type in (tokenize.NL, tokenize.COMMENT):
+            j += 1
+        if j < n and tokens[j].type == tokenize.NEWLINE:
+            j += 1
+            while j < n and tokens[j].type in (tokenize.NL, tokenize.COMMENT):
+                j += 1
+            block = j < n and tokens[j].type == tokenize.INDENT
+            j = j + 1 if block else n
+        if j < n and tokens[j].type == tokenize.STRING:
+            if spans:
+                (row, col), (endrow, endcol) = tokens[j].start, tokens[j].end
+                heredoc = (starts[row - 1] + col, starts[endrow - 1] + endcol, True)
+            else:
+                heredoc = _literal(tokens[j].string)
+        found.append((keyword, name, ''.join(parts).strip(), heredoc, line, len(scopes)))
+        # an indented body is a new scope until the matching dedent
+        if block:
+            scopes.append(indent)
+    return found
+
+engines = {'regex': _parseregex, 'ast': _parseast, 'tokenize': _parsetokens}
+
+def parsetext(t, engine='regex', spans=False):
+    """parsetext(string, engine='regex', spans=False)
+    returns a list of (keyword, name, arglist, heredoc, line, depth)
+    tuples for every class and function found in the source text.
+    engine is a key of the engines dict, 'regex', 'ast' or 'tokenize',
+    further engines can be added to the dict.
+    with spans=True heredoc is a (start, end, literal) tuple of string
+    offsets instead, or None. literal is True when the span is a whole
+    string literal to evaluate and False for the raw heredoc text.
+    """
+    return engines[engine](t, spans)
+
+def _bytespans(t, found, encoding='utf-8', start=0):
+    """_bytespans(string, found, encoding='utf-8', start=0)
+    turn the string offsets of parsetext(spans=True) into
+    (offset, length, literal) in the encoded bytes of the string,
+    start is the length of a byte order mark before them
+    """
+    if t.isascii():
+        return [(k, n, a, (start + h[0], h[1] - h[0], h[2]) if h else None, l, d) for k, n, a, h, l, d in found]
+    offsets = {}
+    pos, size = 0, start
+    for p in sorted(set(p for h in (f[3] for f in found) if h for p in h[:2])):
+        size += len(t[pos:p].encode(encoding))
+        offsets[p], pos = size, p
+    return [(k, n, a, (offsets[h[0]], offsets[h[1]] - offsets[h[0]], h[2]) if h else None, l, d)
+        for k, n, a, h, l, d in found]
+
+rxb = re.compile(rx.pattern.encode(), re.MULTILINE)
+
+def _parsebytes(data, end, encoding='utf-8', spans=False):
+    """_parsebytes(data, end, encoding='utf-8', spans=False)
+    the regex engine run over the undecoded bytes of a file, up to
+    end, only the names, arglists and heredocs found are decoded.
+    spans are (offset, length, literal) in the bytes
+    """
+    found = []
+    line, pos = 1, 0
+    for m in rxb.finditer(data, 0, end):
+        line += data[pos:m.start(2)].count(b'\n')
+        pos = m.start(2)
+        try:
+            heredoc = (m.group(6) or b'').decode(encoding)
+            if spans:
+                heredoc = (m.start(6), m.end(6) - m.start(6), False) if not m.group(6) == None else None
+            found.append((m.group(2).decode(), m.group(3).decode(encoding).strip(),
+                (m.group(4) or b'').decode(encoding).strip(), heredoc, line, 0))
+        except UnicodeDecodeError:
+            raise SourceError(None, 'not valid {} at line {}'.format(encoding, line), 'decode')
+    return found
+
+rxref = re.compile(rb'''
+    (?:\#[^\n]*|[rRbBuUfF]{0,2}(?:"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+        |\b(?:def|class)[ \t]+\w+)
+    |^[ \t]*from[ \t]+([\w.]+)[ \t]+import[ \t]*(\([^)]*\)|[^\n\#;]*)
+    |^[ \t]*import[ \t]+([^\n\#;]*)
+    |\.[ \t]*([^\W\d]\w*)([ \t]*\()?
+    |\b([^\W\d]\w*)[ \t]*\(
+    |\b([^\W\d]\w*)\b(?![ \t]*=(?!=))
+    ''', re.MULTILINE | re.VERBOSE)
+
+_keywords = frozenset(k.encode() for k in keyword.kwlist)
+
+refkinds = ('call', 'attr', 'import', 'name')
+
+def _importnames(clause):
+    """_importnames(clause)
+    the names of an import clause, 'a.b as c, (d, e)' gives a.b, d, e
+    """
+    names = (part.split()[0] for part in clause.strip().strip('()').split(',') if part.strip())
+    return [name for name in names if not name in ('*', '\\')]
+
+def _parserefs(data, end, encoding='utf-8'):
+    """_parserefs(data, end, encoding='utf-8')
+    the names a file uses, up to end of its bytes, as (kind, name,
+    module, None, line, 0) tuples in the shape of parsetext() results.
+    kind is 'call' for name( and .name(, 'attr' for other .name,
+    'import' for the modules and names it imports and 'name' for any
+    other bare name which isn't a keyword or being set with =, module
+    is where a name is imported from. strings and comments are
+    skipped, so are the names given to def and class
+    """
+    found = []
+    line, pos = 1, 0
+    for m in rxref.finditer(data, 0, end):
+        # which alternative matched, None for strings, comments and definitions
+        group = m.lastindex
+        if group == None:
+            continue
+        line += data[pos:m.start()].count(b'\n')
+        pos = m.start()
+        if group == 2:
+            module = m.group(1).decode(encoding, 'replace')
+            found.append(('import', module, module, None, line, 0))
+            found.extend(('import', name, module, None, line, 0)
+                for name in _importnames(m.group(2).decode(encoding, 'replace')))
+        elif group == 3:
+            found.extend(('import', name, name, None, line, 0)
+                for name in _importnames(m.group(3).decode(encoding, 'replace')))
+        elif group == 4:
+            found.append(('attr', m.group(4).decode(), '', None, line, 0))
+        elif group == 5:
+            found.append(('call', m.group(4).decode(), '', None, line, 0))
+        elif group == 6:
+            if not m.group(6) in _keywords:
+                found.append(('call', m.group(6).decode(), '', None, line, 0))
+        elif not m.group(7) in _keywords:
+            found.append(('name', m.group(7).decode(), '', None, line, 0))
+    return found
+
+class SourceError(ValueError):
+    """SourceError(filepath, message, reason)
+    a file which couldn't be searched, reason is 'read', 'decode' or
+    'size'. parseall() returns these in place of the results of bad
+    files, so one file doesn't end the search, and they are shown as
+    'error' Records
+    """
+
+    def __init__(self, filepath, message, reason):
+        ValueError.__init__(self, filepath, message, reason)
+        self.filepath = filepath
+        self.message = message
+        self.reason = reason
+
+    def __str__(self):
+        return self.message
+
+mmapsize = 1 << 20
+
+def _encoding(data):
+    """_encoding(data)
+    the encoding of python source bytes from its byte order mark or
+    PEP 263 coding cookie, utf-8 if there is neither
+    """
+    try:
+        return tokenize.detect_encoding(io.BytesIO(data[:4096]).readline)[0]
+    except SyntaxError:
+        return 'utf-8'
+
+def _readsource(file, maxsize=None, truncate=False):
+    """_readsource(file, maxsize=None, truncate=False)
+    returns (data, end, encoding) for a python file open in binary
+    mode. data is the bytes of the file, or a read-only mmap of them
+    for files of mmapsize or more, which the caller closes. end is
+    where parsing stops, encoding follows the byte order mark or
+    PEP 263 coding cookie. files over maxsize bytes raise SourceError,
+    or with truncate only their first maxsize bytes are parsed
+    """
+    size = fstat(file.fileno()).st_size
+    end = size
+    if not maxsize == None and size > maxsize:
+        if not truncate:
+            raise SourceError(file.name, 'skipped, {} bytes is over the {} byte limit'.format(size, maxsize), 'size')
+        end = maxsize
+    if size >= mmapsize:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        data = file.read()
+    if end < size:
+        # stop at the end of a line
+        end = data.rfind(b'\n', 0, end) + 1
+    return data, end, _encoding(data)
+
+def _parsesource(data, end, encoding, engine='regex', spans=False, refs=False):
+    """_parsesource(data, end, encoding, engine='regex', spans=False, refs=False)
+    parse what _readsource() returned. the regex engine reads the
+    bytes, the others decode the file first and fall back to the
+    regex engine when it won't decode. with refs the _parserefs()
+    results follow the symbols. raises SourceError for text which
+    isn't valid in its encoding
+    """
+    found = None
+    if not engine == 'regex':
+        try:
+            text = data[:end].decode(encoding)
+        except UnicodeDecodeError:
+            pass
+        else:
+            found = parsetext(text, engine, spans)
+            if spans:
+                start = 3 if encoding == 'utf-8-sig' else 0
+                found = _bytespans(text, found, 'utf-8' if start else encoding, start)
+    if found == None:
+        found = _parsebytes(data, end, 'utf-8' if encoding == 'utf-8-sig' else encoding, spans)
+    if refs:
+        found.extend(_parserefs(data, end, 'utf-8' if encoding == 'utf-8-sig' else encoding))
+    return found
+
+def _lacks(data, end, encoding, needle):
+    """_lacks(data, end, encoding, needle)
+    True if the string needle is certainly not in the source, a quick
+    check which saves parsing files that can't match a name pattern
+    """
+    try:
+        return data.find(needle.encode(encoding.replace('-sig', '')), 0, end) < 0
+    except (LookupError, UnicodeError):
+        return False
+
+def parsefile(filepath, digest=False, engine='regex', spans=False, maxsize=None, truncate=False, needle=None,
+    refs=False):
+    """parsefile(filepath, digest=False, engine='regex', spans=False, maxsize=None, truncate=False, needle=None,
+    refs=False)
+    read a python file and return the parsetext() result for it,
+    or a (sha1 hexdigest, result) tuple if digest is True.
+    with spans=True heredocs are (offset, length, literal) byte spans
+    of the file, for Symbol. large files are memory mapped, the coding
+    cookie is honoured and with the regex engine only the symbols
+    found are decoded. maxsize and truncate limit the size of files,
+    see _readsource(). with needle, a string, None is returned
+    without parsing when the file doesn't contain it. with refs the
+    names the file uses follow its symbols, see _parserefs(). raises
+    SourceError for a file which is too big or can't be decoded,
+    and OSError if it can't be read
+    """
+    with open(filepath, 'rb') as file:
+        data, end, encoding = _readsource(file, maxsize, truncate)
+    try:
+        if needle and _lacks(data, end, encoding, needle):
+            return None
+        found = _parsesource(data, end, encoding, engine, spans, refs)
+        if digest:
+            return sha1(data).hexdigest(), found
+        return found
+    except SourceError as e:
+        raise SourceError(filepath, e.message, e.reason)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+def _failed(filepath, error):
+    """_failed(filepath, error)
+    returns a SourceError for an exception raised by a file
+    """
+    if isinstance(error, SourceError):
+        return error if error.filepath else SourceError(filepath, error.message, error.reason)
+    return SourceError(filepath, 'could not be read, {}'.format(error.strerror or error), 'read')
+
+def _parsechunk(filepaths, digest=False, engine='regex', spans=False, maxsize=None, truncate=False, needle=None,
+    refs=False):
+    """_parsechunk(filepaths, digest=False, engine='regex', spans=False, maxsize=None, truncate=False, needle=None,
+    refs=False)
+    parsefile() for a batch of files, run inside a worker process,
+    files which fail give a SourceError instead of a result
+    """
+    results = []
+    for filepath in filepaths:
+        try:
+            results.append(parsefile(filepath, digest, engine, spans, maxsize, truncate, needle, refs))
+        except (SourceError, OSError) as e:
+            results.append(_failed(filepath, e))
+    return results
+
+def parseall(filepaths, workers=1, digest=False, engine='regex', spans=False, maxsize=None, truncate=False):
+    """parseall(filepaths, workers=1, digest=False, engine='regex', spans=False, maxsize=None, truncate=False)
+    parse a list of files and return the results in the same order.
+    with more than one worker the list is split into chunks which
+    are parsed in a process pool, workers=None uses every core.
+    a file which can't be read or decoded, or is over maxsize, gives
+    a SourceError in place of its result.
+    """
+    if workers == None:
+        workers = cpu_count() or 1
+    if workers <= 1 or len(filepaths) < 2:
+        return _parsechunk(filepaths, digest, engine, spans, maxsize, truncate)
+    size = max(1, min(64, len(filepaths) // (workers * 4)))
+    chunks = [filepaths[i:i + size] for i in range(0, len(filepaths), size)]
+    n = len(chunks)
+    with ProcessPoolExecutor(min(workers, n)) as pool:
+        return [r for chunk in pool.map(_parsechunk, chunks, repeat(digest, n), repeat(engine, n),
+            repeat(spans, n), repeat(maxsize, n), repeat(truncate, n)) for r in chunk]
+
+class Symbol:
+    """Symbol(fileid, kind, name, arglist, line, depth, docoffset=None, doclength=0, docliteral=False)
+    compact record of one class or function for trees and indexes
+    kept in memory. fileid is a position in its owner's list of
+    paths and the heredoc stays in the file, docoffset and doclength
+    are its byte span, read back with readdocs() when it is needed.
+    """
+    __slots__ = ('fileid', 'kind', 'name', 'arglist', 'line', 'depth', 'docoffset', 'doclength', 'docliteral')
+
+    def __init__(self, fileid, kind, name, arglist, line, depth, docoffset=None, doclength=0, docliteral=False):
+        self.fileid = fileid
+        self.kind = kind
+        # the same names and arglists turn up in many files
+        self.name = sys.intern(name)
+        self.arglist = sys.intern(arglist)
+        self.line = line
+        self.depth = depth
+        self.docoffset = docoffset
+        self.doclength = doclength
+        self.docliteral = docliteral
+
+    def __repr__(self):
+        return 'Symbol({!r}, {!r}, {!r}, {!r}, {!r}, {!r}, {!r}, {!r}, {!r})'.format(self.fileid, self.kind,
+            self.name, self.arglist, self.line, self.depth, self.docoffset, self.doclength, self.docliteral)
+
+def makesymbols(fileid, found):
+    """makesymbols(fileid, found)
+    returns a list of Symbols for a parsefile(spans=True) result
+    """
+    return [Symbol(fileid, keyword, name, arglist, line, depth, *(span or (None, 0, False)))
+        for keyword, name, arglist, span, line, depth in found]
+
+def readdocs(filepath, symbols, mtime_ns=None, size=None):
+    """readdocs(filepath, symbols, mtime_ns=None, size=None)
+    returns the heredocs of a file's Symbols as a list of strings,
+    the file is memory mapped and only the spans are decoded.
+    mtime_ns and size are those of the file the symbols were parsed
+    from, if it has changed since then the heredocs are all ''
+    """
+    docs = [''] * len(symbols)
+    if not any(s.docoffset != None for s in symbols):
+        return docs
+    try:
+        with open(filepath, 'rb') as file:
+            now = fstat(file.fileno())
+            if now.st_size == 0 or not size == None and not (now.st_mtime_ns, now.st_size) == (mtime_ns, size):
+                return docs
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                encoding = _encoding(data)
+                if encoding == 'utf-8-sig':
+                    encoding = 'utf-8'
+                for i, s in enumerate(symbols):
+                    if not s.docoffset == None:
+                        text = data[s.docoffset:s.docoffset + s.doclength].decode(encoding, 'replace')
+                        docs[i] = _literal(text) if s.docliteral else text
+    except (OSError, ValueError):
+        pass
+    return docs
+
+def _parsetimed(filepath, digest=False, engine='regex', spans=False, maxsize=None, truncate=False, needle=None,
+    refs=False):
+    """_parsetimed(filepath, digest=False, engine='regex', spans=False, maxsize=None, truncate=False, needle=None,
+    refs=False)
+    parsefile() which also returns the bytes read and the wall and
+    cpu seconds of reading and of parsing, for Stats
+    """
+    start, cpu = perf_counter(), process_time()
+    read, readcpu = start, cpu
+    data, nbytes = None, 0
+    try:
+        with open(filepath, 'rb') as file:
+            data, end, encoding = _readsource(file, maxsize, truncate)
+        read, readcpu = perf_counter(), process_time()
+        if needle and _lacks(data, end, encoding, needle):
+            found = None
+        else:
+            found = _parsesource(data, end, encoding, engine, spans, refs)
+        if digest and found != None:
+            found = sha1(data).hexdigest(), found
+        nbytes = end
+    except (SourceError, OSError) as e:
+        found = _failed(filepath, e)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+    return found, nbytes, read - start, readcpu - cpu, perf_counter() - read, process_time() - readcpu
+
+def _parsechunktimed(filepaths, digest=False, engine='regex', spans=False, maxsize=None, truncate=False, needle=None,
+    refs=False):
+    """_parsechunktimed(filepaths, digest=False, engine='regex', spans=False, maxsize=None, truncate=False, needle=None,
+    refs=False)
+    _parsechunk() with _parsetimed(), run inside a worker process
+    """
+    return [_parsetimed(f, digest, engine, spans, maxsize, truncate, needle, refs) for f in filepaths]
+
+class Stats:
+    """Stats(top=10, hook=None)
+    timings and counters for one search, pass it to iter_modsearch or
+    modsearch as stats= and read it afterwards, or give a hook which
+    is called with the Stats when the search ends, e.g. to export it.
+    wall, cpu     dicts of seconds per phase: walk, stat, index, read,
+                  parse, render and output. read and parse are summed
+                  over files, so with workers they can exceed total
+    total         wall seconds of the whole search
+    dirs          directories scanned
+    files         files read and parsed, cached files aren't read
+    cached        files found in the index
+    copies        hard links and identical copies of files parsed
+                  elsewhere in the search, which weren't parsed again
+    bytes         bytes read
+    symbols       classes and functions found
+    errors        files which couldn't be searched, see SourceError
+    decodeerrors  those of them which couldn't be decoded
+    slowest       the top slowest files to read and parse, as
+                  (seconds, filepath) pairs, slowest first
+    asdict() returns all of it for json and report() as text.
+    when no Stats is given none of this is measured.
+    """
+    phases = ('walk', 'stat', 'index', 'read', 'parse', 'render', 'output')
+
+    def __init__(self, top=10, hook=None):
+        self.top = top
+        self.hook = hook
+        self.wall = dict.fromkeys(self.phases, 0.0)
+        self.cpu = dict.fromkeys(self.phases, 0.0)
+        self.total = 0.0
+        self.dirs = 0
+        self.files = 0
+        self.cached = 0
+        self.copies = 0
+        self.bytes = 0
+        self.symbols = 0
+        self.errors = 0
+        self.decodeerrors = 0
+        self._slowest = []
+
+    def start(self):
+        """start()
+        returns the wall and cpu clocks, to hand back to stop()
+        """
+        return perf_counter(), process_time()
+
+    def stop(self, phase, started):
+        """stop(phase, started)
+        add the time since start() to phase
+        """
+        self.wall[phase] += perf_counter() - started[0]
+        self.cpu[phase] += process_time() - started[1]
+
+    def failed(self, error):
+        """failed(error)
+        count a file which gave a SourceError
+        """
+        self.errors += 1
+        if error.reason == 'decode':
+            self.decodeerrors += 1
+
+    def parsed(self, filepath, nbytes, readwall, readcpu, parsewall, parsecpu):
+        """parsed(filepath, nbytes, readwall, readcpu, parsewall, parsecpu)
+        add the counts and times of one parsed file
+        """
+        self.files += 1
+        self.bytes += nbytes
+        self.wall['read'] += readwall
+        self.cpu['read'] += readcpu
+        self.wall['parse'] += parsewall
+        self.cpu['parse'] += parsecpu
+        if self.top:
+            item = (readwall + parsewall, filepath)
+            if len(self._slowest) < self.top:
+                heappush(self._slowest, item)
+            else:
+                heappushpop(self._slowest, item)
+
+    @property
+    def slowest(self):
+        return sorted(self._slowest, reverse=True)
+
+    def done(self):
+        """done()
+        called at the end of a search, calls the hook
+        """
+        if self.hook:
+            self.hook(self)
+
+    def asdict(self):
+        """asdict()
+        returns the timings and counters as a dict of plain values
+        """
+        return {'total': self.total, 'wall': dict(self.wall), 'cpu': dict(self.cpu),
+            'dirs': self.dirs, 'files': self.files, 'cached': self.cached, 'copies': self.copies,
+            'bytes': self.bytes, 'symbols': self.symbols, 'errors': self.errors, 'decodeerrors': self.decodeerrors,
+            'slowest': [[seconds, filepath] for seconds, filepath in self.slowest]}
+
+    def report(self):
+        """report()
+        returns a few lines of text summarising the search
+        """
+        lines = ['profile: {:.3f}s, {} dirs, {} files read, {} cached, {} copies, {} bytes, {} symbols, '
+            '{} errors, {} decode errors'.format(self.total, self.dirs, self.files, self.cached, self.copies,
+            self.bytes, self.symbols, self.errors, self.decodeerrors)]
+        for phase in self.phases:
+            lines.append('    {:8}{:9.3f}s wall {:9.3f}s cpu'.format(phase, self.wall[phase], self.cpu[phase]))
+        if self._slowest:
+            lines.append('    slowest files:')
+            lines.extend('    {:9.3f}s {}'.format(seconds, filepath) for seconds, filepath in self.slowest)
+        return '\n'.join(lines)
+
+class SymbolIndex:
+    """SymbolIndex(dbpath=None, rebuild=False, verify=False)
+    a persistent on-disk index of parsed python files, stored in sqlite.
+    entries are keyed by path and engine and validated against mtime_ns and size,
+    so repeat searches only parse files which have changed.
+    dbpath     string, index file, defaults to ~/.cache/modsearch/index.sqlite
+    rebuild    boolean, discard existing entries for each searched root
+    verify     boolean, also compare a sha1 of the file content, catching
+               edits which keep the same mtime and size
+    hits, misses and removed count cached files, parsed files and
+    entries dropped for deleted files.
+    whole installed distributions and zip archives are also kept,
+    keyed by their RECORD or archive, see lookupdist(). its tables are
+    modsearch_files and modsearch_dists, other tables in dbpath are
+    left alone.
+    the database is in WAL mode and changes are committed a directory
+    at a time, so searches sharing it don't wait on each other. if it
+    is locked all the same, locked is set and the search carries on
+    without the index.
+    """
+
+    def __init__(self, dbpath=None, rebuild=False, verify=False):
+        if dbpath == None:
+            dbpath = defaultindex
+        dbpath = expanduser(dbpath)
+        if dirname(dbpath):
+            makedirs(dirname(dbpath), exist_ok=True)
+        self.db = sqlite3.connect(dbpath)
+        self.rebuild = rebuild
+        self.verify = verify
+        self.locked = False
+        self.seen = set()
+        self.hits = 0
+        self.misses = 0
+        self.removed = 0
+        try:
+            self.db.execute('PRAGMA journal_mode = WAL')
+            self.db.execute('PRAGMA synchronous = NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS modsearch_files (path TEXT, engine TEXT, '
+                'mtime_ns INTEGER, size INTEGER, hash TEXT, symbols TEXT, PRIMARY KEY (path, engine))')
+            self.db.execute('CREATE TABLE IF NOT EXISTS modsearch_dists (key TEXT, engine TEXT, symbols TEXT, '
+                'PRIMARY KEY (key, engine))')
+            self.db.commit()
+        except sqlite3.OperationalError as e:
+            self._contended(e)
+
+    def _contended(self, error):
+        """_contended(error)
+        give up on a database another search holds, it's only a cache,
+        so the search goes on without it. other errors are raised
+        """
+        if not 'locked' in str(error):
+            raise error
+        self.db.rollback()
+        self.locked = True
+
+    def _write(self, sql, args=()):
+        """_write(sql, args=())
+        run a statement which changes the index, unless it is locked
+        """
+        if self.locked:
+            return
+        try:
+            self.db.execute(sql, args)
+        except sqlite3.OperationalError as e:
+            self._contended(e)
+
+    def _read(self, sql, args=()):
+        """_read(sql, args=())
+        returns the first row of a query, or None if the index is locked
+        """
+        if self.locked:
+            return None
+        try:
+            return self.db.execute(sql, args).fetchone()
+        except sqlite3.OperationalError as e:
+            self._contended(e)
+            return None
+
+    def _range(self, root):
+        """_range(root)
+        returns the bounds of all indexed paths below root
+        """
+        root = root.rstrip(sep) + sep
+        return root, root[:-1] + chr(ord(sep) + 1)
+
+    def begin(self, root):
+        """begin(root)
+        start a search of root, dropping its entries when rebuilding
+        """
+        if self.rebuild:
+            self._write('DELETE FROM modsearch_files WHERE path >= ? AND path < ?', self._range(root))
+            self.commit()
+
+    def lookup(self, filepath, st, engine='regex'):
+        """lookup(filepath, stat_result, engine='regex')
+        returns the indexed parsetext() result for a file, or None
+        if there is no entry or the entry is out of date. with verify
+        a file which can't be read is a miss too, so parsing it gives
+        the error
+        """
+        self.seen.add(filepath)
+        row = self._read('SELECT mtime_ns, size, hash, symbols FROM modsearch_files WHERE path = ? AND engine = ?',
+            (filepath, engine))
+        if row and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+            if self.verify:
+                try:
+                    with open(filepath, 'rb') as file:
+                        digest = sha1(file.read()).hexdigest()
+                except OSError:
+                    digest = None
+                if not digest == row[2]:
+                    self.misses += 1
+                    return None
+            self.hits += 1
+            return [tuple(d) for d in json.loads(row[3])]
+        self.misses += 1
+        return None
+
+    def store(self, filepath, st, digest, found, engine='regex'):
+        """store(filepath, stat_result, digest, found, engine='regex')
+        add or replace the entry for a freshly parsed file, it is
+        written with the next commit()
+        """
+        self._write('INSERT OR REPLACE INTO modsearch_files VALUES (?, ?, ?, ?, ?, ?)',
+            (filepath, engine, st.st_mtime_ns, st.st_size, digest, json.dumps(found)))
+
+    def lookupdist(self, key, engine='regex'):
+        """lookupdist(key, engine='regex')
+        returns the {relative path: parsetext() result} stored for a
+        distribution or zip archive, or None. key changes whenever the
+        distribution or archive does, so there is nothing to validate
+        """
+        if self.rebuild:
+            return None
+        row = self._read('SELECT symbols FROM modsearch_dists WHERE key = ? AND engine = ?', (key, engine))
+        if row:
+            return dict((name, [tuple(d) for d in found]) for name, found in json.loads(row[0]).items())
+        return None
+
+    def storedist(self, key, found, engine='regex'):
+        """storedist(key, found, engine='regex')
+        add or replace the {relative path: result} of a distribution
+        """
+        self._write('INSERT OR REPLACE INTO modsearch_dists VALUES (?, ?, ?)', (key, engine, json.dumps(found)))
+        self.commit()
+
+    def commit(self):
+        """commit()
+        commit what has been stored, done after each directory so no
+        transaction is left open while the output is read
+        """
+        if self.locked:
+            return
+        try:
+            self.db.commit()
+        except sqlite3.OperationalError as e:
+            self._contended(e)
+
+    def finish(self, root):
+        """finish(root)
+        drop entries below root for files which no longer exist
+        and commit the changes
+        """
+        if self.locked:
+            return
+        try:
+            filepaths = self.db.execute('SELECT DISTINCT path FROM modsearch_files WHERE path >= ? AND path < ?',
+                self._range(root)).fetchall()
+        except sqlite3.OperationalError as e:
+            self._contended(e)
+            return
+        for (filepath,) in filepaths:
+            if not filepath in self.seen and not exists(filepath):
+                self._write('DELETE FROM modsearch_files WHERE path = ?', (filepath,))
+                self.removed += not self.locked
+        self.commit()
+
+    def report(self):
+        """report()
+        returns a one line summary of the hit and miss counts
+        """
+        return 'index: {} hits, {} misses, {} removed{}'.format(self.hits, self.misses, self.removed,
+            ', locked by another search so not updated' if self.locked else '')
+
+    def close(self):
+        """close()
+        commit and close the index file
+        """
+        self.commit()
+        self.db.close()
+
+def _checkpath(path):
+    """_checkpath(path)
+    normalise the search path, returns (path, error message or None)
+    """
+    if path == None:
+        path = getcwd()
+    else:
+        path = expanduser(normpath(path))
+    if exists(path):
+        if not isdir(path):
+            return path, 'The specified search path is not a directory.'
+        if not access(path, R_OK):
+            return path, 'Insufficient privilege to read the specified path.'
+    else:
+        return path, 'The specified path does not exist.'
+    return path, None
+
+def _checkpaths(path):
+    """_checkpaths(path)
+    normalise one search path or a list of them, dropping repeats,
+    returns (list of roots, error message or None)
+    """
+    paths = path if isinstance(path, (list, tuple)) else [path]
+    roots, seen = [], set()
+    for path in paths:
+        path, error = _checkpath(path)
+        if error:
+            return roots, error if len(paths) == 1 else '{}: {}'.format(path, error)
+        if not realpath(path) in seen:
+            seen.add(realpath(path))
+            roots.append(path)
+    return roots, None
+
+def _readignore(dirpath):
+    """_readignore(dirpath)
+    returns the lines of the .gitignore in dirpath, if there is one
+    """
+    try:
+        with open(join(dirpath, '.gitignore'), 'rt') as f:
+            return f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return []
+
+def _rules(base, patterns):
+    """_rules(base, patterns)
+    compile gitignore style patterns, relative to base, into
+    (base, pattern, negate, dironly, anchored) tuples.
+    a trailing / only matches directories, a leading or inner /
+    matches the path from base rather than just the name
+    """
+    rules = []
+    for p in patterns:
+        p = p.strip()
+        if not p or p.startswith('#'):
+            continue
+        negate = p.startswith('!')
+        if negate:
+            p = p[1:]
+        dironly = p.endswith('/')
+        if p.startswith('**/'):
+            p = p[3:]
+        anchored = '/' in p.rstrip('/')
+        p = p.strip('/')
+        if p:
+            rules.append((base, p, negate, dironly, anchored))
+    return rules
+
+def _ignored(path, name, isdir, rules):
+    """_ignored(path, name, isdir, rules)
+    check a directory entry against the rules, the last match wins
+    """
+    ignored = False
+    for base, pattern, negate, dironly, anchored in rules:
+        if dironly and not isdir:
+            continue
+        if fnmatchcase(path[len(base):].lstrip(sep) if anchored else name, pattern):
+            ignored = not negate
+    return ignored
+
+def walktree(path, skipdir='', exclude=None, gitignore=False, maxdepth=None, followlinks=False, empty=False, stats=None):
+    """walktree(path, skipdir='', exclude=None, gitignore=False, maxdepth=None, followlinks=False, empty=False, stats=None)
+    scandir based replacement for os.walk, yields (root, entries) for
+    every directory containing python files, where entries are the
+    os.DirEntry objects of the files, in the same order as os.walk.
+    skipdir     directory name to skip
+    exclude     gitignore style pattern or list of patterns to skip,
+                e.g. ['.git/', 'node_modules/', '.tox/', '*venv*/', 'build/lib/']
+    gitignore   boolean, also skip anything matched by .gitignore files
+    maxdepth    int, how many directory levels below path to descend
+    followlinks boolean, descend into symlinked directories, each
+                directory is only visited once so links can't loop
+    empty       boolean, also yield directories without python files
+    stats       Stats, counts the directories scanned
+    """
+    if isinstance(exclude, str):
+        exclude = [exclude]
+    visited = set()
+    stack = [(path, 0, _rules(path, exclude or []))]
+    while stack:
+        root, depth, rules = stack.pop()
+        if followlinks:
+            try:
+                st = stat(root)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+        if gitignore:
+            rules = rules + _rules(root, _readignore(root))
+        try:
+            with scandir(root) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        if stats:
+            stats.dirs += 1
+        pyfiles, subdirs = [], []
+        for entry in entries:
+            try:
+                isdir = entry.is_dir()
+            except OSError:
+                isdir = False
+            if rules and _ignored(entry.path, entry.name, isdir, rules):
+                continue
+            if isdir:
+                if not entry.name == skipdir and (followlinks or not entry.is_symlink()):
+                    subdirs.append(entry.path)
+            elif splitext(entry.name)[1] == '.py' and not entry.name == '__init__.py':
+                pyfiles.append(entry)
+        if len(pyfiles)>0 or empty:
+            yield root, pyfiles
+        if maxdepth == None or depth < maxdepth:
+            stack.extend((subdir, depth + 1, rules) for subdir in reversed(subdirs))
+
+_Filters = namedtuple('_Filters', 'pathglob newer older name hasdoc needle docs spans refs')
+_Filters.__doc__ = """_Filters(pathglob, newer, older, name, hasdoc, needle, docs, spans, refs)
+the filters of a search, see iter_modsearch. needle is a string
+every matching name contains, files without it aren't parsed, and
+with spans heredocs are left as spans as they won't be shown.
+with refs the names files use are extracted as well
+"""
+
+_nofilters = _Filters(None, None, None, None, None, None, True, False, False)
+
+def _filters(pathglob=None, newer=None, older=None, name=None, hasdoc=None, docs=True, spans=False, refs=False):
+    """_filters(pathglob=None, newer=None, older=None, name=None, hasdoc=None, docs=True, spans=False, refs=False)
+    returns the _Filters of a search
+    """
+    # the longest plain run of the pattern, '*parse*conf?' gives 'parse'
+    needle = max(re.split(r'[*?]|\[[^\]]*\]', name), key=len) if name else None
+    return _Filters(pathglob, newer, older, name, hasdoc, needle, docs, spans, refs)
+
+def _indexkey(engine, filters):
+    """_indexkey(engine, filters)
+    the engine name results are indexed under, with references they
+    are kept apart from plain results, and from those of before
+    'name' references
+    """
+    return engine + ':refs2' if filters.refs else engine
+
+def _pruned(filters, filepath=None, mtime=None):
+    """_pruned(filters, filepath=None, mtime=None)
+    True if a file is left out by its path or modified time, either
+    may be None to check only the other
+    """
+    if not filepath == None and not filters.pathglob == None and not fnmatchcase(filepath, filters.pathglob):
+        return True
+    return not mtime == None and ((not filters.newer == None and mtime < filters.newer) or
+        (not filters.older == None and mtime >= filters.older))
+
+def _filtering(filters):
+    """_filtering(filters)
+    True if filters can leave out files, so empty directories aren't listed
+    """
+    return not filters[:5] == (None, None, None, None, None)
+
+def _submit(pool, fn, *args):
+    """_submit(pool, fn, *args)
+    run fn on the pool, or straight away when there is no pool,
+    returns a Future either way
+    """
+    if pool == None:
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+    return pool.submit(fn, *args)
+
+class _Shared:
+    """_Shared()
+    a file submitted for parsing, which copies found later in the
+    search share, its result is item pos of future once submitted
+    """
+    __slots__ = ('future', 'pos')
+
+    def __init__(self):
+        self.future = None
+        self.pos = None
+
+    def result(self):
+        return self.future.result()[self.pos]
+
+def _filehash(filepath):
+    """_filehash(filepath)
+    returns the sha1 hexdigest of a file, or None if it can't be read
+    """
+    digest = sha1()
+    try:
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(mmapsize), b''):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def _truncated(size, limits):
+    """_truncated(size, limits)
+    True if only the start of a file of size bytes is parsed, such
+    results are partial and mustn't be cached as the file's
+    """
+    maxsize, truncate = limits
+    return truncate == True and not maxsize == None and size > maxsize
+
+def _dirjob(root, entries, index, pool, parse, engine, limits=(None, False), profile=None, known=None, shared=None,
+    filters=_nofilters):
+    """_dirjob(root, entries, index, pool, parse, engine, limits=(None, False), profile=None, known=None, shared=None,
+    filters=_nofilters)
+    stat the files of one directory, leaving out those which filters
+    prune by path and mtime, look the rest up in known, a dict of
+    results by file path, then in the index and submit the rest for
+    parsing in chunks, returns the pending job.
+    shared is a dict kept for the whole search, by (st_dev, st_ino)
+    and by (size, sha1), of files already found, so that hard links
+    and identical copies take the result of the first one found
+    rather than being parsed again. files are only hashed once
+    another file of the same size turns up, the first of each size
+    is kept by its size until then
+    """
+    if profile:
+        started = profile.start()
+    filepaths, stats = [], []
+    for entry in entries:
+        # by path before the stat and by mtime before the file is opened
+        if _pruned(filters, entry.path):
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        if _pruned(filters, None, st.st_mtime):
+            continue
+        stats.append(st)
+        filepaths.append(entry.path)
+    if profile:
+        profile.stop('stat', started)
+        started = profile.start()
+    found = [None] * len(filepaths)
+    todo = []
+    copies = 0
+    if parse:
+        for i, filepath in enumerate(filepaths):
+            if known and filepath in known:
+                found[i] = known[filepath]
+                index.hits += 1
+                continue
+            if shared != None:
+                inode = (stats[i].st_dev, stats[i].st_ino)
+                if inode in shared:
+                    found[i] = shared[inode]
+                    copies += isinstance(found[i], _Shared)
+                    continue
+            if index:
+                found[i] = index.lookup(filepath, stats[i], _indexkey(engine, filters))
+            if shared != None and found[i] == None:
+                size = stats[i].st_size
+                first = shared.get(size)
+                found[i] = shared[inode] = _Shared()
+                if not size in shared:
+                    shared[size] = (filepath, found[i])
+                    todo.append(i)
+                    continue
+                if first:
+                    # a second file of this size, so the first is hashed after all
+                    shared[size] = None
+                    digest = _filehash(first[0])
+                    if digest:
+                        shared[(size, digest)] = first[1]
+                content = (size, _filehash(filepath))
+                if content in shared:
+                    found[i] = shared[inode] = shared[content]
+                    copies += 1
+                    continue
+                if content[1]:
+                    shared[content] = found[i]
+                todo.append(i)
+            elif shared != None:
+                shared[inode] = found[i]
+            elif found[i] == None:
+                todo.append(i)
+    if profile:
+        profile.stop('index', started)
+        if parse:
+            profile.cached += len(filepaths) - len(todo) - copies
+            profile.symbols += sum(len(symbols) for symbols in found if isinstance(symbols, list))
+    jobs = []
+    for n in range(0, len(todo), 64):
+        chunk = todo[n:n + 64]
+        jobs.append((chunk, _submit(pool, _parsechunktimed if profile else _parsechunk,
+            [filepaths[i] for i in chunk], bool(index), engine, filters.spans, *limits, filters.needle, filters.refs)))
+        for pos, i in enumerate(chunk):
+            if found[i] != None:
+                found[i].future, found[i].pos = jobs[-1][1], pos
+    return root, filepaths, stats, found, jobs
+
+def _symbolrecords(filepath, symbols, classes, functions, filters=_nofilters):
+    """_symbolrecords(filepath, symbols, classes, functions, filters=_nofilters)
+    yields the class and def Records of one file which pass filters,
+    followed by its references when filters.refs is set
+    """
+    name, hasdoc, docs = filters.name, filters.hasdoc, filters.docs
+    for keyword, symbol, arglist, heredoc, line, depth in symbols or []:
+        if keyword in refkinds:
+            if filters.refs and (name == None or fnmatchcase(symbol, name)):
+                yield Record(keyword, filepath, symbol, arglist, '', None, line, depth)
+            continue
+        if not ((keyword == 'class' and classes == True) or (keyword == 'def' and functions == True)):
+            continue
+        if (not name == None and not fnmatchcase(symbol, name)) or (not hasdoc == None and not bool(heredoc) == hasdoc):
+            continue
+        yield Record(keyword, filepath, symbol, arglist, heredoc if docs == True else '', None, line, depth)
+
+def _filerecords(filepath, mtime, symbols, classes, functions, filters=_nofilters):
+    """_filerecords(filepath, mtime, symbols, classes, functions, filters=_nofilters)
+    returns the Records of one file, the file and its symbols or the
+    error, or none at all when filtering by name or heredoc finds
+    nothing in it
+    """
+    if isinstance(symbols, SourceError):
+        return [Record('file', filepath, basename(filepath), '', '', mtime),
+            Record('error', filepath, '', '', str(symbols), None)]
+    records = list(_symbolrecords(filepath, symbols, classes, functions, filters))
+    if not records and not (filters.name == None and filters.hasdoc == None):
+        return records
+    return [Record('file', filepath, basename(filepath), '', '', mtime)] + records
+
+def _dirrecords(job, index, classes, functions, engine, profile=None, sink=None, filters=_nofilters,
+    limits=(None, False)):
+    """_dirrecords(job, index, classes, functions, engine, profile=None, sink=None, filters=_nofilters,
+    limits=(None, False))
+    wait for a job from _dirjob() and yield its records, a directory
+    left empty by the filters isn't listed. sink(filepath, result)
+    is called for each file parsed in full, truncated files aren't
+    stored in the index either
+    """
+    root, filepaths, stats, found, jobs = job
+    parsed = ((i, result, False) for chunk, future in jobs for i, result in zip(chunk, future.result()))
+    # copies of files parsed elsewhere in the search take their result
+    copies = ((i, shared.result(), True) for i, shared in enumerate(found) if isinstance(shared, _Shared))
+    for i, result, copy in chain(parsed, copies):
+        if profile:
+            if copy:
+                profile.copies += 1
+            else:
+                profile.parsed(filepaths[i], *result[1:])
+            result = result[0]
+        if result == None:
+            # didn't contain filters.needle, so it wasn't parsed or stored
+            found[i] = []
+            continue
+        if isinstance(result, SourceError):
+            if profile:
+                profile.failed(result)
+            found[i] = result
+            continue
+        if profile:
+            started = profile.start()
+        partial = _truncated(stats[i].st_size, limits)
+        if index:
+            if not partial:
+                index.store(filepaths[i], stats[i], result[0], result[1], _indexkey(engine, filters))
+            result = result[1]
+        if profile:
+            profile.stop('index', started)
+            profile.symbols += len(result)
+        if sink and not partial:
+            sink(filepaths[i], result)
+        found[i] = result
+    if index and jobs:
+        index.commit()
+    head = [Record('dir', root, '', '', '', None)]
+    for filepath, st, symbols in zip(filepaths, stats, found):
+        records = _filerecords(filepath, st.st_mtime, symbols, classes, functions, filters)
+        if records:
+            yield from head
+            head = []
+            yield from records
+    if not _filtering(filters):
+        yield from head
+
+def _timedwalk(walker, stats):
+    """_timedwalk(walker, stats)
+    pass on the results of walktree(), adding the time spent in it
+    to the walk phase of stats
+    """
+    while True:
+        started = stats.start()
+        item = next(walker, None)
+        stats.stop('walk', started)
+        if item == None:
+            return
+        yield item
+
+class _Prefetch:
+    """_Prefetch(makers, threads, ahead=64)
+    calls each of makers, functions returning an iterator such as
+    walktree(), on a pool of threads and keeps up to ahead of their
+    items queued, so the trees of a search with several roots are
+    walked at once while the first is still being parsed.
+    items(n) yields the items of the nth in order, close() stops them
+    """
+
+    def __init__(self, makers, threads, ahead=64):
+        self.stopped = threading.Event()
+        self.queues = [queue.Queue(ahead) for maker in makers]
+        self.pool = ThreadPoolExecutor(threads)
+        for maker, q in zip(makers, self.queues):
+            self.pool.submit(self._run, maker, q)
+
+    def _put(self, q, item):
+        """_put(q, item)
+        wait for room in q, returns False if closed meanwhile
+        """
+        while not self.stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self, maker, q):
+        try:
+            for item in maker():
+                if not self._put(q, ('item', item)):
+                    return
+        except Exception as e:
+            self._put(q, ('error', e))
+        else:
+            self._put(q, ('end', None))
+
+    def items(self, n):
+        """items(n)
+        yields the items of the nth iterator, raising its exception
+        """
+        while True:
+            kind, item = self.queues[n].get()
+            if kind == 'end':
+                return
+            if kind == 'error':
+                raise item
+            yield item
+
+    def close(self):
+        self.stopped.set()
+        self.pool.shutdown(cancel_futures=True)
+
+def importroots(environment=True):
+    """importroots(environment=True)
+    returns the import roots of a python environment, directories
+    and zip archives, without duplicates or missing entries.
+    environment is True for this interpreter's sys.path, a list of
+    paths, or the path of a virtualenv or of a python executable,
+    which is run to ask for its sys.path. the first entry python adds
+    for the script's directory, or '' for the current one, isn't an
+    import root of the environment and is left out, as are empty entries
+    """
+    # without -P or PYTHONSAFEPATH, sys.path[0] is the script directory
+    if environment == True:
+        paths = sys.path if getattr(sys.flags, 'safe_path', False) else sys.path[1:]
+    elif isinstance(environment, (list, tuple)):
+        paths = environment
+    else:
+        python = expanduser(environment)
+        if isdir(python):
+            for name in (join('bin', 'python'), join('Scripts', 'python.exe')):
+                if exists(join(python, name)):
+                    python = join(python, name)
+                    break
+        code = 'import sys, json; print(json.dumps(sys.path if getattr(sys.flags, "safe_path", False) else sys.path[1:]))'
+        try:
+            result = subprocess.run([python, '-c', code], stdout=subprocess.PIPE, check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise ValueError('Not a python environment: {} ({})'.format(environment, e))
+        paths = json.loads(result.stdout)
+    roots = []
+    for p in paths:
+        if not p:
+            continue
+        p = realpath(expanduser(p))
+        if not p in roots and (isdir(p) or zipfile.is_zipfile(p)):
+            roots.append(p)
+    return roots
+
+def _nested(root, roots):
+    """_nested(root, roots)
+    exclude patterns for the other roots inside root, which are
+    searched on their own
+    """
+    return ['/' + relpath(other, root).replace(sep, '/') + '/' for other in roots
+        if other.startswith(root.rstrip(sep) + sep) and isdir(other)]
+
+def _dists(root):
+    """_dists(root)
+    returns {filepath: (key, relative path)} for the python files of
+    the distributions installed in root, key is a hash of the RECORD
+    of the distribution, which lists the hash of every file it has
+    """
+    owners = {}
+    try:
+        with scandir(root) as it:
+            records = [join(e.path, 'RECORD') for e in it if e.name.endswith('.dist-info') and e.is_dir()]
+    except OSError:
+        return owners
+    for record in records:
+        try:
+            with open(record, 'rb') as f:
+                data = f.read()
+        except OSError:
+            continue
+        key = 'dist:' + sha1(data).hexdigest()
+        for row in csv.reader(data.decode(errors='replace').splitlines()):
+            if row and row[0].endswith('.py'):
+                filepath = normpath(join(root, row[0]))
+                if filepath.startswith(root.rstrip(sep) + sep):
+                    owners[filepath] = (key, row[0])
+    return owners
+
+def _distsearch(root, index, engine, search):
+    """_distsearch(root, index, engine, search)
+    run search(known, sink) over root, taking the results of files
+    from unchanged distributions out of the index and storing the
+    distributions which had to be parsed
+    """
+    owners = _dists(root) if index else {}
+    groups, known, parsed = {}, {}, {}
+    for key in set(key for key, name in owners.values()):
+        groups[key] = index.lookupdist(key, engine) or {}
+    for filepath, (key, name) in owners.items():
+        if name in groups[key]:
+            known[filepath] = groups[key][name]
+
+    def sink(filepath, result):
+        if filepath in owners:
+            key, name = owners[filepath]
+            parsed.setdefault(key, dict(groups[key]))[name] = result
+
+    yield from search(known, sink)
+    for key, found in parsed.items():
+        index.storedist(key, found, engine)
+
+def _ziprecords(archive, classes, functions, engine, index=None, limits=(None, False), profile=None, filters=_nofilters):
+    """_ziprecords(archive, classes, functions, engine, index=None, limits=(None, False), profile=None, filters=_nofilters)
+    yields the Records of the python files inside a zip archive, an
+    egg or zipapp, read with zipfile without unpacking. paths are
+    archive/member as for zipimport. the results are kept in the
+    index per archive, keyed by its path, mtime and size
+    """
+    maxsize, truncate = limits
+    parse = classes == True or functions == True
+    try:
+        st = stat(archive)
+        key = 'zip:{}:{}:{}'.format(archive, st.st_mtime_ns, st.st_size)
+        cached = index.lookupdist(key, _indexkey(engine, filters)) if index and parse else None
+        # members filtered out keep their cached results
+        found = dict(cached) if cached else {}
+        with zipfile.ZipFile(archive) as z:
+            members = [m for m in z.infolist() if m.filename.endswith('.py') and
+                not basename(m.filename) == '__init__.py' and not m.is_dir()]
+            # the same order as walking the directories
+            members.sort(key=lambda m: (m.filename.split('/')[:-1], m.filename))
+            folder = None
+            for m in members:
+                filepath = join(archive, m.filename)
+                mtime = mktime(m.date_time + (0, 0, -1))
+                if _pruned(filters, filepath, mtime):
+                    continue
+                result = None
+                if parse and cached and m.filename in cached:
+                    result = cached[m.filename]
+                    index.hits += 1
+                elif parse and not maxsize == None and m.file_size > maxsize and not truncate:
+                    result = SourceError(filepath, 'skipped, {} bytes is over the {} byte limit'.format(
+                        m.file_size, maxsize), 'size')
+                elif parse:
+                    data = z.read(m)
+                    if index:
+                        index.misses += 1
+                    end = len(data) if maxsize == None or len(data) <= maxsize else data.rfind(b'\n', 0, maxsize) + 1
+                    encoding = _encoding(data)
+                    try:
+                        if not (filters.needle and _lacks(data, end, encoding, filters.needle)):
+                            result = _parsesource(data, end, encoding, engine, False, filters.refs)
+                    except SourceError as e:
+                        result = SourceError(filepath, e.message, e.reason)
+                    if profile:
+                        profile.files += 1
+                        profile.bytes += end
+                if isinstance(result, SourceError):
+                    if profile:
+                        profile.failed(result)
+                elif not result == None and not _truncated(m.file_size, limits):
+                    found[m.filename] = result
+                records = _filerecords(filepath, mtime, result, classes, functions, filters)
+                if records and not dirname(m.filename) == folder:
+                    folder = dirname(m.filename)
+                    yield Record('dir', join(archive, folder) if folder else archive, '', '', '', None)
+                yield from records
+        if index and parse and not found == cached:
+            index.storedist(key, found, _indexkey(engine, filters))
+    except (OSError, zipfile.BadZipFile, RuntimeError) as e:
+        yield Record('error', archive, '', '', 'could not be read, {}'.format(e), None)
+
+def iter_modsearch(path=None, classes=True, functions=True, skipdir='', index=None, rebuild=False, verify=False, workers=1, engine='regex',
+    exclude=None, gitignore=False, maxdepth=None, followlinks=False, maxsize=None, truncate=False, environment=None, stats=None,
+    dedupe=None, docs=True, name=None, hasdoc=None, pathglob=None, newer=None, older=None, refs=False):
+    """iter_modsearch(path=None, classes=True, functions=True, skipdir='',
+    index=None, rebuild=False, verify=False, workers=1, engine='regex',
+    exclude=None, gitignore=False, maxdepth=None, followlinks=False,
+    maxsize=None, truncate=False, environment=None, stats=None, dedupe=None,
+    docs=True, name=None, hasdoc=None, pathglob=None, newer=None, older=None,
+    refs=False)
+    generator behind modsearch, yields a Record for each directory,
+    file, class and function as soon as it is found, rather than
+    building the whole output first. the options match modsearch,
+    index may also be an open SymbolIndex, which is left open.
+    stats may be a Stats, which is filled in as the search runs.
+    with environment the import roots from importroots(environment)
+    are searched instead of path.
+    the filters are applied as early as they can be: files outside
+    pathglob are dropped before they are stat'ed, and those outside
+    newer and older before they are opened. a file which doesn't
+    contain the plain part of name isn't parsed, and heredocs are
+    not kept when docs is False. with name or hasdoc only files with
+    matching symbols are listed.
+    with refs each file's symbols are followed by a Record for every
+    name it uses, see _parserefs(), in the same pass over the file.
+    their kind is 'call', 'attr', 'import' or 'name' and arglist holds
+    the module of an import, name filters them too. they are indexed
+    apart from plain results.
+    raises ValueError if path is not a readable directory.
+    """
+    if environment:
+        roots = importroots(environment)
+    else:
+        roots, error = _checkpaths(path)
+        if error:
+            raise ValueError(error)
+    if not engine in engines:
+        raise ValueError('Unknown engine: {}'.format(engine))
+    owned = index == True or isinstance(index, str)
+    if owned:
+        index = SymbolIndex(None if index == True else index, rebuild, verify)
+    parse = classes == True or functions == True
+    if workers == None:
+        workers = cpu_count() or 1
+    pool = ProcessPoolExecutor(workers) if workers > 1 and parse else None
+    if isinstance(exclude, str):
+        exclude = [exclude]
+    if dedupe == None:
+        dedupe = len(roots) > 1
+    shared = {} if dedupe and parse else None
+    # heredocs which won't be shown are left as spans, except in the index
+    filters = _filters(pathglob, newer, older, name, hasdoc, docs, not docs == True and not index, refs)
+    trees = [path for path in roots if isdir(path)]
+
+    def walk(path):
+        """walk(path)
+        walktree() with the options of this search
+        """
+        return walktree(path, skipdir, (exclude or []) + _nested(path, roots), gitignore, maxdepth,
+            followlinks, stats=stats)
+
+    # walking is mostly waiting on the disk, so several trees are walked at once in threads
+    prefetch = _Prefetch([lambda path=path: walk(path) for path in trees], min(len(trees), 8)) \
+        if len(trees) > 1 else None
+
+    def search(path, known=None, sink=None):
+        """search(path, known=None, sink=None)
+        yields the records of one directory tree
+        """
+        pending = deque()
+        if index:
+            index.begin(path)
+        walker = prefetch.items(trees.index(path)) if prefetch else walk(path)
+        if stats:
+            walker = _timedwalk(walker, stats)
+        for root, entries in walker:
+            pending.append(_dirjob(root, entries, index, pool, parse, engine, (maxsize, truncate), stats, known,
+                shared, filters))
+            # keep a few directories in flight so the pool stays busy
+            while len(pending) > (workers * 2 if pool else 0):
+                yield from _dirrecords(pending.popleft(), index, classes, functions, engine, stats, sink, filters,
+                    (maxsize, truncate))
+        while pending:
+            yield from _dirrecords(pending.popleft(), index, classes, functions, engine, stats, sink, filters,
+                (maxsize, truncate))
+        if index:
+            if stats:
+                started = stats.start()
+            index.finish(path)
+            if stats:
+                stats.stop('index', started)
+
+    if stats:
+        start = perf_counter()
+    try:
+        for path in roots:
+            if not isdir(path):
+                yield from _ziprecords(path, classes, functions, engine, index, (maxsize, truncate), stats, filters)
+            elif environment and index and parse:
+                yield from _distsearch(path, index, _indexkey(engine, filters), lambda known, sink: search(path, known, sink))
+            else:
+                yield from search(path)
+    finally:
+        if prefetch:
+            prefetch.close()
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if owned:
+            index.close()
+        if stats:
+            stats.total += perf_counter() - start
+            stats.done()
+
+class _Inotify:
+    """_Inotify()
+    minimal ctypes wrapper around the linux inotify calls,
+    raises OSError where inotify isn't available
+    """
+    # IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO,
+    # IN_CREATE, IN_DELETE and IN_DELETE_SELF
+    mask = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400
+    isdir = 0x40000000
+    overflow = 0x4000
+    ignored = 0x8000
+
+    def __init__(self):
+        try:
+            libc = ctypes.CDLL(find_library('c'), use_errno=True)
+            self._add = libc.inotify_add_watch
+            self.fd = libc.inotify_init1(O_CLOEXEC)
+        except (OSError, AttributeError):
+            raise OSError('inotify is not available')
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.dirs = {}
+        self.watched = {}
+
+    def watch(self, dirs):
+        """watch(dirs)
+        add a watch for each directory which isn't watched yet,
+        raises OSError when the system watch limit is reached
+        """
+        for d in dirs:
+            if d in self.watched:
+                continue
+            wd = self._add(self.fd, fsencode(d), self.mask)
+            if wd < 0:
+                if ctypes.get_errno() == ENOSPC:
+                    raise OSError(ENOSPC, 'inotify watch limit reached')
+                continue
+            self.watched.pop(self.dirs.get(wd), None)
+            self.dirs[wd] = d
+            self.watched[d] = wd
+
+    def read(self, timeout):
+        """read(timeout)
+        wait up to timeout seconds for events, returns a list of
+        (path, mask) tuples, empty if nothing happened
+        """
+        if not select([self.fd], [], [], timeout)[0]:
+            return []
+        data = osread(self.fd, 65536)
+        events = []
+        pos = 0
+        while pos + 16 <= len(data):
+            wd, mask, cookie, length = struct.unpack_from('iIII', data, pos)
+            name = data[pos + 16:pos + 16 + length].rstrip(b'\0')
+            pos += 16 + length
+            if mask & self.ignored:
+                self.watched.pop(self.dirs.pop(wd, None), None)
+                continue
+            base = self.dirs.get(wd)
+            if base == None and not mask & self.overflow:
+                continue
+            events.append((join(base, fsdecode(name)) if base and name else base, mask))
+        return events
+
+    def close(self):
+        """close()
+        release the inotify file descriptor
+        """
+        osclose(self.fd)
+
+class Watcher:
+    """Watcher(path=None, callback=None, classes=True, functions=True, skipdir='',
+    index=None, workers=1, engine='regex', exclude=None, gitignore=False,
+    maxdepth=None, followlinks=False, maxsize=None, truncate=False,
+    interval=1.0, settle=0.2, poll=False)
+    keeps the classes and functions of a tree in memory and updates
+    them as files change. the tree is walked and parsed once, then
+    run() waits for changes, using inotify on linux and polling the
+    file mtimes elsewhere, and only parses files which changed.
+    callback(watcher, changed, removed) is called with the file paths
+    of each update, records() yields the current state as Records,
+    hold watcher.lock while reading it from another thread.
+    classes and functions are kept as Symbols, heredocs are read back
+    from the files by records(), so large trees stay small in memory.
+    interval   seconds between polls, or between checks of stop()
+    settle     seconds without events before a burst is handled,
+               so a branch checkout becomes a single update
+    poll       boolean, poll even where inotify is available
+    the other options match modsearch, index may be an open SymbolIndex
+    """
+
+    def __init__(self, path=None, callback=None, classes=True, functions=True, skipdir='',
+        index=None, workers=1, engine='regex', exclude=None, gitignore=False,
+        maxdepth=None, followlinks=False, maxsize=None, truncate=False,
+        interval=1.0, settle=0.2, poll=False):
+        path, error = _checkpath(path)
+        if error:
+            raise ValueError(error)
+        if not engine in engines:
+            raise ValueError('Unknown engine: {}'.format(engine))
+        self.path = path
+        self.callback = callback
+        self.classes = classes
+        self.functions = functions
+        self.walkoptions = (skipdir, exclude, gitignore, maxdepth, followlinks)
+        self.index = index
+        self.workers = workers
+        self.engine = engine
+        self.limits = (maxsize, truncate)
+        self.interval = interval
+        self.settle = settle
+        self.poll = poll
+        self.files = {}
+        self.dirs = []
+        self.paths = []
+        self.fileids = {}
+        self.skipped = set()
+        self.lock = threading.RLock()
+        if index:
+            index.begin(path)
+        self.sync()
+        if index:
+            index.finish(path)
+
+    def _parse(self, files, todo):
+        """_parse(files, todo)
+        parse the (root, filepath, stat_result) tuples in todo and
+        store the results in files
+        """
+        found = [[] for t in todo]
+        # the index holds spans under their own key, apart from heredocs
+        engine = self.engine + ':spans'
+        if self.classes == True or self.functions == True:
+            missed = []
+            for i, (root, filepath, st) in enumerate(todo):
+                found[i] = self.index.lookup(filepath, st, engine) if self.index else None
+                if found[i] == None:
+                    missed.append(i)
+            results = parseall([todo[i][1] for i in missed], self.workers, bool(self.index), self.engine, True,
+                *self.limits)
+            for i, result in zip(missed, results):
+                if isinstance(result, SourceError):
+                    found[i] = result
+                    continue
+                if self.index:
+                    if not _truncated(todo[i][2].st_size, self.limits):
+                        self.index.store(todo[i][1], todo[i][2], result[0], result[1], engine)
+                    result = result[1]
+                found[i] = result
+            if self.index:
+                self.index.commit()
+        for (root, filepath, st), result in zip(todo, found):
+            fileid = self.fileids.get(filepath)
+            if fileid == None:
+                fileid = self.fileids[filepath] = len(self.paths)
+                self.paths.append(filepath)
+            if not isinstance(result, SourceError):
+                result = makesymbols(fileid, result)
+            files[root][filepath] = (st.st_mtime_ns, st.st_size, st.st_mtime, result)
+
+    def sync(self):
+        """sync()
+        walk the whole tree again, parse new and changed files and
+        forget removed ones, returns (changed, removed) file paths
+        """
+        files, dirs, todo = {}, [], []
+        for root, entries in walktree(self.path, *self.walkoptions, empty=True):
+            dirs.append(root)
+            old = self.files.get(root, {})
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                state = old.get(entry.path)
+                if state == None or not state[:2] == (st.st_mtime_ns, st.st_size):
+                    todo.append((root, entry.path, st))
+                files.setdefault(root, {})[entry.path] = state
+        self._parse(files, todo)
+        removed = [f for root in self.files for f in self.files[root] if not f in files.get(root, ())]
+        self.files, self.dirs = files, dirs
+        self.skipped = set()
+        return [t[1] for t in todo], removed
+
+    def update(self, paths):
+        """update(paths)
+        check just the given paths, a new python file which isn't
+        known yet falls back to sync(), returns (changed, removed).
+        that is decided before anything is forgotten, so the files
+        sync() finds removed include those in paths
+        """
+        for filepath in paths:
+            if not filepath in self.files.get(dirname(filepath), {}) and splitext(filepath)[1] == '.py' and \
+                not basename(filepath) == '__init__.py' and not filepath in self.skipped:
+                changed, removed = self.sync()
+                # anything still unknown is excluded, don't rescan for it again
+                self.skipped.update(p for p in paths if not p in self.files.get(dirname(p), {}))
+                return changed, removed
+        todo, removed = [], []
+        for filepath in paths:
+            root = dirname(filepath)
+            files = self.files.get(root, {})
+            if not filepath in files:
+                continue
+            try:
+                st = stat(filepath)
+            except OSError:
+                del files[filepath]
+                removed.append(filepath)
+                if not files:
+                    del self.files[root]
+                continue
+            if not files[filepath][:2] == (st.st_mtime_ns, st.st_size):
+                todo.append((root, filepath, st))
+        self._parse(self.files, todo)
+        return [t[1] for t in todo], removed
+
+    def records(self, filepaths=None, docs=True):
+        """records(filepaths=None, docs=True)
+        yields Records for the current state of the tree, or only
+        for the given file paths. heredocs are read from the files
+        as they are reached, with docs=False they are left empty.
+        """
+        kinds = set()
+        if self.classes == True:
+            kinds.add('class')
+        if self.functions == True:
+            kinds.add('def')
+        for root, files in self.files.items():
+            chosen = [f for f in files if filepaths == None or f in filepaths]
+            if len(chosen)>0:
+                yield Record('dir', root, '', '', '', None)
+            for filepath in chosen:
+                mtime_ns, size, mtime, found = files[filepath]
+                yield Record('file', filepath, basename(filepath), '', '', mtime)
+                if isinstance(found, SourceError):
+                    yield Record('error', filepath, '', '', str(found), None)
+                    continue
+                found = [s for s in found if s.kind in kinds]
+                heredocs = readdocs(filepath, found, mtime_ns, size) if docs == True else repeat('')
+                for s, heredoc in zip(found, heredocs):
+                    yield Record(s.kind, filepath, s.name, s.arglist, heredoc, None, s.line, s.depth)
+
+    def run(self, stop=None):
+        """run(stop=None)
+        wait for changes and update the state until stop() returns True,
+        calling callback(watcher, changed, removed) after each update
+        """
+        source = None
+        if not self.poll:
+            try:
+                source = _Inotify()
+            except OSError:
+                source = None
+        try:
+            while not (stop and stop()):
+                if source:
+                    try:
+                        source.watch(self.dirs)
+                    except OSError:
+                        source.close()
+                        source = None
+                        continue
+                    events = source.read(self.interval)
+                    if not events:
+                        continue
+                    # coalesce a burst of events into one update
+                    deadline = monotonic() + max(1.0, self.settle * 10)
+                    while monotonic() < deadline:
+                        more = source.read(self.settle)
+                        if not more:
+                            break
+                        events.extend(more)
+                    with self.lock:
+                        if any(mask & (source.isdir | source.overflow) or basename(p or '') == '.gitignore'
+                            for p, mask in events):
+                            changed, removed = self.sync()
+                        else:
+                            changed, removed = self.update(set(p for p, mask in events))
+                else:
+                    sleep(self.interval)
+                    with self.lock:
+                        changed, removed = self.sync()
+                if (changed or removed) and self.callback:
+                    self.callback(self, changed, removed)
+        finally:
+            if source:
+                source.close()
+
+colorschemes = {
+    'deepblue': {
+        'pathcolor': {'trucolor': '#0086d2', '256': 'DeepSkyBlue3'},
+        'filecolor': {'trucolor': '#fb660a', '256': 'OrangeRed1'},
+        'keywordcolor': {'trucolor': '#fb660a', '256': 'OrangeRed1'},
+        'functioncolor': {'trucolor': '#cdcaa9', '256': 'LightYellow3'},
+        'arglistcolor': {'trucolor': '#0086d2', '256': 'DeepSkyBlue3'},
+        'linkcolor': {'trucolor': '#ffffff', '256': 'White'},
+        'timestampcolor': {'trucolor': '#0086f7', '256': 'DodgerBlue1'},
+        'commentcolor': {'trucolor': '#5bc4bf', '256': 'Aquamarine3'},
+        'setbackgroundcolor': '\033[48;2;0;0;11m'
+    },
+    'chocolate': {
+        'pathcolor': {'trucolor': '#ffafd7', '256': 'Pink1'},
+        'filecolor': {'trucolor': '#ffd7af', '256': 'NavajoWhite1'},
+        'keywordcolor': {'trucolor': '#ffff00', '256': 'Yellow'},
+        'functioncolor': {'trucolor': '#ff0000', '256': 'Red'},
+        'arglistcolor': {'trucolor': '#ffffd7', '256': 'Cornsilk1'},
+        'linkcolor': {'trucolor': '#ff87af', '256': 'PaleVioletRed1'},
+        'timestampcolor': {'trucolor': '#ffaf00', '256': 'Orange1'},
+        'commentcolor': {'trucolor': '#ffffff', '256': 'Grey100'},
+        'setbackgroundcolor': '\033[48;5;234m'
+    },
+    'bright': {
+        'pathcolor': {'trucolor': '#af0087', '256': 'MediumVioletRed'},
+        'filecolor': {'trucolor': '#870000', '256': 'DarkRed'},
+        'keywordcolor': {'trucolor': '#0000ff', '256': 'Blue1'},
+        'functioncolor': {'trucolor': '#005fff', '256': 'DodgerBlue2'},
+        'arglistcolor': {'trucolor': '#262626', '256': 'Grey15'},
+        'linkcolor': {'trucolor': '#5f00af', '256': 'Purple4'},
+        'timestampcolor': {'trucolor': '#00875f', '256': 'SpringGreen4'},
+        'commentcolor': {'trucolor': '#000000', '256': 'Black'},
+        'setbackgroundcolor': '\033[48;5;15m'
+    }
+}
+
+def unjob(s):
+    """unjob(string)
+    fake function for lambda
+    returns the string it receives, unchanged.
+    """
+    return s
+
+class Renderer:
+    """Renderer(links=True, modified=True, docs=True, colormode='trucolor', scheme='deepblue')
+    the display side of modsearch, turns Records into colored lines.
+    spans() returns the lines of one record as (style, text) spans,
+    render() the same as strings, and emit() writes records to
+    streams between the background color codes.
+    """
+    tab = '    '
+
+    def __init__(self, links=True, modified=True, docs=True, colormode='trucolor', scheme='deepblue'):
+        self.links = links
+        self.modified = modified
+        self.docs = docs
+        if not scheme in colorschemes:
+            scheme = 'deepblue'
+        if colormode == 'trucolor' or colormode == '256':
+            colors = colorschemes[scheme]
+            self.pathcolor = Style(colors['pathcolor'][colormode], mode=colormode)
+            self.filecolor = Style(colors['filecolor'][colormode], mode=colormode)
+            self.keywordcolor = Style(colors['keywordcolor'][colormode], mode=colormode)
+            self.functioncolor = Style(colors['functioncolor'][colormode], mode=colormode)
+            self.arglistcolor = Style(colors['arglistcolor'][colormode], mode=colormode)
+            self.linkcolor = Style(colors['linkcolor'][colormode], mode=colormode)
+            self.timestampcolor = Style(colors['timestampcolor'][colormode], mode=colormode)
+            self.commentcolor = Style(colors['commentcolor'][colormode], mode=colormode)
+            self.setbackground = colors['setbackgroundcolor']
+            self.clearbackground = resetbg
+        else:
+            plain = Style(mode='none')
+            self.pathcolor = plain
+            self.filecolor = plain
+            self.keywordcolor = plain
+            self.functioncolor = plain
+            self.arglistcolor = plain
+            self.linkcolor = plain
+            self.timestampcolor = plain
+            self.commentcolor = plain
+            self.setbackground = ''
+            self.clearbackground = ''
+
+    def spans(self, record):
+        """spans(record)
+        returns the display lines for one record, each a list of
+        (style, text) spans with None for plain text
+        """
+        tab = self.tab
+        if record.kind == 'dir':
+            return [[(self.pathcolor, record.path)]]
+        if record.kind == 'file':
+            lines = [[(None, tab), (self.filecolor, record.name)]]
+            if self.links == True:
+                lines.append([(None, tab*2), (self.linkcolor, 'file://' + re.sub(' ', r'\ ', record.path))])
+            if self.modified == True:
+                lines.append([(None, tab*2), (self.timestampcolor, 'Modified: ' + str(ctime(record.mtime)))])
+            return lines
+        if record.kind == 'error':
+            return [[(None, tab*2), (self.timestampcolor, 'Error: ' + record.heredoc)]]
+        indent = tab * (2 + record.depth)
+        if record.kind == 'class':
+            lines = [[(None, indent), (self.keywordcolor, record.kind), (None, ' '),
+                (self.functioncolor, record.name), (self.arglistcolor, record.arglist)]]
+        else:
+            lines = [[(None, indent), (self.functioncolor, record.name), (self.arglistcolor, record.arglist)]]
+        if self.docs == True and not record.heredoc == '':
+            commentcolor = self.commentcolor
+            indent += tab
+            lines.extend([(None, indent), (commentcolor, s.strip())] for s in record.heredoc.split('\n'))
+        return lines
+
+    def render(self, record):
+        """render(record)
+        returns the display lines for one record as strings, every
+        colored span wrapped in its own codes
+        """
+        return [''.join(style(text) if style else text for style, text in line) for line in self.spans(record)]
+
+    def emit(self, records, streams, stats=None):
+        """emit(records, streams, stats=None)
+        write the records to each stream through a SpanWriter, between
+        the background color codes, a Stats gets the render and output
+        times. each color code is only written when the color changes
+        """
+        writer = SpanWriter(*streams)
+        writer.raw(self.setbackground + '\n')
+        newline = False
+        if stats:
+            for record in records:
+                started = stats.start()
+                lines = self.spans(record)
+                stats.stop('render', started)
+                started = stats.start()
+                for spans in lines:
+                    if newline:
+                        writer.raw('\n')
+                    writer.write(spans)
+                    newline = True
+                stats.stop('output', started)
+        else:
+            for record in records:
+                for spans in self.spans(record):
+                    if newline:
+                        writer.raw('\n')
+                    writer.write(spans)
+                    newline = True
+        writer.reset()
+        writer.raw(self.clearbackground)
+        writer.flush()
+
+formats = ('text', 'jsonl', 'sqlite')
+
+def _docless(record, docs):
+    """_docless(record, docs)
+    the record without its heredoc, unless docs is True
+    """
+    if docs == True or record.kind == 'error' or not record.heredoc:
+        return record
+    return record._replace(heredoc='')
+
+def writejsonl(records, stream, docs=True, stats=None):
+    """writejsonl(records, stream, docs=True, stats=None)
+    write each record to stream as a line of JSON, an object with
+    the Record field names, as soon as it is found. returns the count
+    """
+    encode = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(',', ':')).encode
+    fields = Record._fields
+    count = 0
+    for record in records:
+        if stats:
+            started = stats.start()
+        line = encode(dict(zip(fields, _docless(record, docs)))) + '\n'
+        if stats:
+            stats.stop('render', started)
+            started = stats.start()
+        stream.write(line)
+        if stats:
+            stats.stop('output', started)
+        count += 1
+    return count
+
+def writesqlite(records, dbpath, docs=True, stats=None, batch=10000):
+    """writesqlite(records, dbpath, docs=True, stats=None, batch=10000)
+    write the records to a new sqlite database at dbpath, replacing
+    it, as one table records with the Record fields as columns in
+    search order, indexed on name, kind and path. rows are inserted
+    batch at a time in a single transaction and the file is only
+    moved into place once complete. returns the count
+    """
+    temp = dbpath + '.tmp'
+    if exists(temp):
+        unlink(temp)
+    db = sqlite3.connect(temp, isolation_level=None)
+    count = 0
+    try:
+        # a fresh file which replaces dbpath when done, so there's nothing to journal
+        db.execute('PRAGMA journal_mode = OFF')
+        db.execute('PRAGMA synchronous = OFF')
+        db.execute('BEGIN')
+        db.execute('CREATE TABLE records (kind TEXT, path TEXT, name TEXT, arglist TEXT, heredoc TEXT, '
+            'mtime REAL, line INTEGER, depth INTEGER)')
+        rows = []
+        for record in records:
+            if stats:
+                started = stats.start()
+            rows.append(_docless(record, docs))
+            if stats:
+                stats.stop('render', started)
+            if len(rows) >= batch:
+                if stats:
+                    started = stats.start()
+                db.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                if stats:
+                    stats.stop('output', started)
+                count += len(rows)
+                rows = []
+        if stats:
+            started = stats.start()
+        db.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        count += len(rows)
+        # indexes are quicker to build once the rows are in
+        for column in ('name', 'kind', 'path'):
+            db.execute('CREATE INDEX records_{0} ON records ({0})'.format(column))
+        db.execute('COMMIT')
+        if stats:
+            stats.stop('output', started)
+    except BaseException:
+        db.close()
+        unlink(temp)
+        raise
+    db.close()
+    replace(temp, dbpath)
+    return count
+
+def modsearch(path=None, links=True, modified=True, classes=True, functions=True, docs=True, saveas=None, colormode='trucolor', scheme='deepblue', skipdir='', index=None, rebuild=False, verify=False, workers=1, engine='regex', exclude=None, gitignore=False, maxdepth=None, followlinks=False, maxsize=None, truncate=False, environment=None, watch=False, stats=None, hook=None, dedupe=None, format='text', name=None, hasdoc=None, pathglob=None, newer=None, older=None, limit=None, page=None):
     """modsearch(path=None, links=True, modified=True, classes=True, functions=True, 
-    docs=True, saveas=None, colormode='trucolor', scheme='deepblue', skipdir='')
+    docs=True, saveas=None, colormode='trucolor', scheme='deepblue', skipdir='',
+    index=None, rebuild=False, verify=False, workers=1, engine='regex',
+    exclude=None, gitignore=False, maxdepth=None, followlinks=False, maxsize=None,
+    truncate=False, environment=None, watch=False, stats=None, hook=None,
+    dedupe=None, format='text', name=None, hasdoc=None, pathglob=None,
+    newer=None, older=None, limit=None, page=None)
     a simple, terminal based python module search, returns a list
     of python files, with classes, functions, methods and heredocs
     with syntax highlighting and optional output to file.
@@ -19,153 +2185,1135 @@ def modsearch(path=None, links=True, modified=True, classes=True, functions=True
     
     Use the following options to set a search directory and save path,
     disable details and change the formatting of the display.
-    path       string, directory path to search
+    path       string, directory path to search, or a list of them,
+               which are walked at the same time
     links      boolean, show clickable links to files
     modified   boolean, show file modified time
     classes    boolean, show classes
     functions  boolean, show functions
     docs       boolean, show heredocs
-    saveas     string, file path to a copy of output
+    saveas     string, file path to a copy of output, or for jsonl and
+               sqlite the file the output is written to
     colors     string, set display color mode: none, 256, trucolor
     scheme     string, choose color scheme: 'deepblue', 'chocolate' or 'bright'
     skipdir    directory name to skip in search
+    index      True or string, keep parsed files in a persistent index,
+               True uses ~/.cache/modsearch/index.sqlite
+    rebuild    boolean, discard the indexed entries for path and reparse
+    verify     boolean, check indexed files against a content hash as well
+               as mtime and size
+    workers    int, number of processes used to parse files, 1 parses
+               in-process, None uses every core
+    engine     string, how files are parsed: 'regex', 'ast' or 'tokenize',
+               ast and tokenize find every signature and indent methods
+               under their classes
+    exclude    gitignore style pattern or list of patterns to skip,
+               e.g. ['.git/', 'node_modules/', '.tox/', '*venv*/']
+    gitignore  boolean, also skip anything matched by .gitignore files
+    maxdepth   int, how many directory levels below path to search
+    followlinks boolean, search symlinked directories, each directory
+               is only searched once so links can't loop
+    maxsize    int, files over this many bytes are skipped
+    truncate   boolean, parse the first maxsize bytes of larger files
+               rather than skipping them
+    environment True to search everything importable from sys.path,
+               or the path of a virtualenv or python executable to
+               search its sys.path, path is ignored. zipped eggs and
+               zipapps are read without unpacking and, with an index,
+               installed distributions are only parsed again when
+               their RECORD changes
+    watch      boolean, keep running after the output and print the
+               entries of files as they change, saveas is rewritten
+               after each change, stop with ctrl-c
+    stats      True, or an int for the number of slowest files to list,
+               times each phase of the search, counts directories,
+               files, bytes and symbols and prints them at the end,
+               a Stats object is filled in rather than printed
+    hook       function, called with the Stats at the end of the search
+    dedupe     boolean, parse hard links and identical copies of a file
+               only once, found by inode and by content hash, None
+               does so when there is more than one root
+    format     string, 'text' for the display, 'jsonl' for a line of
+               JSON per record, to saveas or else stdout, or 'sqlite'
+               for a database at saveas with a records table, indexed
+               on name, kind and path. links, modified and the colors
+               only apply to text
+    name       string, only list classes and functions whose names
+               match this fnmatch pattern, e.g. 'parse*', files which
+               can't contain a match aren't parsed
+    hasdoc     boolean, only list classes and functions with, or
+               when False without, a heredoc
+    pathglob   string, fnmatch pattern files' full paths must match,
+               e.g. '*/tests/test_*.py'
+    newer      number, only search files modified at or after this
+               time, in seconds since the epoch
+    older      number, only search files modified before this time
+    limit      int, stop after this many records, a directory, file,
+               class or function each being one, so the search ends
+               early rather than listing a huge tree
+    page       int, with limit, show the records of this page, 1 being
+               the first, the ones before it are searched but not shown
     NOTES:
     * if colors=True, output saved to file will include
     ansi codes, which will display normally in a terminal,
     but will not be interpretted correctly by most editors.
     set colors to False to save plain text output.
     * scheme setting has no effect if colors=False
+    * with an index, only new or changed files are parsed, the hit
+    and miss counts are printed after the output
+    * output is written as it is found, iter_modsearch() takes the
+    same search options and yields Records instead of printing
+    * files are read in their PEP 263 coding, a file which can't be
+    read or decoded, or is over maxsize, is listed with an Error line
+    rather than ending the search
+    * to look for something rather than list everything, use
+    query('parse config', path, kind='def', limit=20), which ranks
+    names and heredocs through an inverted index kept between calls
+    * references('parse_config', path) lists where a name is called,
+    used as an attribute, imported or used bare, and importgraph(path)
+    what each file imports, both from one extra pass over the files
+    * for release reviews, snapshot(path, 'v1.json') keeps the
+    signatures of a tree and apidiff('v1.json', path) lists the
+    classes and functions added, removed or changed since, as Changes
+    * run modsearch.py with --help for the command line options,
+    modsearch.py --serve starts a daemon which keeps searched trees
+    in memory, modclient.py asks it for records and query results
     """
 
-    if path == None:
-        path = getcwd()
-    else:
-        path = expanduser(normpath(path))
-    if exists(path):
-        if not isdir(path):
-            return 'The specified search path is not a directory.'
-        if not access(path, R_OK):
-            return 'Insufficient privilege to read the specified path.'
+    if environment:
+        if watch == True:
+            return 'Watch mode searches a path, not an environment.'
+        try:
+            environment = importroots(environment)
+        except ValueError as e:
+            return str(e)
     else:
-        return 'The specified path does not exist.'
-
-    colorschemes = {
-        'deepblue': {
-            'pathcolor': {'trucolor': '#0086d2', '256': 'DeepSkyBlue3'},
-            'filecolor': {'trucolor': '#fb660a', '256': 'OrangeRed1'},
-            'keywordcolor': {'trucolor': '#fb660a', '256': 'OrangeRed1'},
-            'functioncolor': {'trucolor': '#cdcaa9', '256': 'LightYellow3'},
-            'arglistcolor': {'trucolor': '#0086d2', '256': 'DeepSkyBlue3'},
-            'linkcolor': {'trucolor': '#ffffff', '256': 'White'},
-            'timestampcolor': {'trucolor': '#0086f7', '256': 'DodgerBlue1'},
-            'commentcolor': {'trucolor': '#5bc4bf', '256': 'Aquamarine3'},
-            'setbackgroundcolor': '\033[48;2;0;0;11m'
-        },
-        'chocolate': {
-            'pathcolor': {'trucolor': '#ffafd7', '256': 'Pink1'},
-            'filecolor': {'trucolor': '#ffd7af', '256': 'NavajoWhite1'},
-            'keywordcolor': {'trucolor': '#ffff00', '256': 'Yellow'},
-            'functioncolor': {'trucolor': '#ff0000', '256': 'Red'},
-            'arglistcolor': {'trucolor': '#ffffd7', '256': 'Cornsilk1'},
-            'linkcolor': {'trucolor': '#ff87af', '256': 'PaleVioletRed1'},
-            'timestampcolor': {'trucolor': '#ffaf00', '256': 'Orange1'},
-            'commentcolor': {'trucolor': '#ffffff', '256': 'Grey100'},
-            'setbackgroundcolor': '\033[48;5;234m'
-        },
-        'bright': {
-            'pathcolor': {'trucolor': '#af0087', '256': 'MediumVioletRed'},
-            'filecolor': {'trucolor': '#870000', '256': 'DarkRed'},
-            'keywordcolor': {'trucolor': '#0000ff', '256': 'Blue1'},
-            'functioncolor': {'trucolor': '#005fff', '256': 'DodgerBlue2'},
-            'arglistcolor': {'trucolor': '#262626', '256': 'Grey15'},
-            'linkcolor': {'trucolor': '#5f00af', '256': 'Purple4'},
-            'timestampcolor': {'trucolor': '#00875f', '256': 'SpringGreen4'},
-            'commentcolor': {'trucolor': '#000000', '256': 'Black'},
-            'setbackgroundcolor': '\033[48;5;15m'
-        }
-    }
-    # output colors
-    if not scheme in colorschemes:
-        scheme = 'deepblue'
-    if colormode == 'trucolor':
-        pathcolor = lambda s: trucolor(s, colorschemes[scheme]['pathcolor']['trucolor'])
-        filecolor = lambda s: trucolor(s, colorschemes[scheme]['filecolor']['trucolor'])
-        keywordcolor = lambda s: trucolor(s, colorschemes[scheme]['keywordcolor']['trucolor'])
-        functioncolor = lambda s: trucolor(s, colorschemes[scheme]['functioncolor']['trucolor'])
-        arglistcolor = lambda s: trucolor(s, colorschemes[scheme]['arglistcolor']['trucolor'])
-        linkcolor = lambda s: trucolor(s, colorschemes[scheme]['linkcolor']['trucolor'])
-        timestampcolor = lambda s: trucolor(s, colorschemes[scheme]['timestampcolor']['trucolor'])
-        commentcolor = lambda s: trucolor(s, colorschemes[scheme]['commentcolor']['trucolor'])
-        setbackground = colorschemes[scheme]['setbackgroundcolor']
-        clearbackground = resetbg
-    elif colormode == '256':
-        pathcolor = lambda s: color256(s, colorschemes[scheme]['pathcolor']['256'])
-        filecolor = lambda s: color256(s, colorschemes[scheme]['filecolor']['256'])
-        keywordcolor = lambda s: color256(s, colorschemes[scheme]['keywordcolor']['256'])
-        functioncolor = lambda s: color256(s, colorschemes[scheme]['functioncolor']['256'])
-        arglistcolor = lambda s: color256(s, colorschemes[scheme]['arglistcolor']['256'])
-        linkcolor = lambda s: color256(s, colorschemes[scheme]['linkcolor']['256'])
-        timestampcolor = lambda s: color256(s, colorschemes[scheme]['timestampcolor']['256'])
-        commentcolor = lambda s: color256(s, colorschemes[scheme]['commentcolor']['256'])
-        setbackground = colorschemes[scheme]['setbackgroundcolor']
-        clearbackground = resetbg
-    else:
-        pathcolor = lambda s: unjob(s)
-        filecolor = lambda s: unjob(s)
-        keywordcolor = lambda s: unjob(s)
-        functioncolor = lambda s: unjob(s)
-        arglistcolor = lambda s: unjob(s)
-        linkcolor = lambda s: unjob(s)
-        timestampcolor = lambda s: unjob(s)
-        commentcolor = lambda s: unjob(s)
-        setbackground = ''
-        clearbackground = ''
-
-    def unjob(s):
-        """unjob(string)
-        fake function for lambda
-        returns the string it receives, unchanged.
-        """
-        return s
+        roots, error = _checkpaths(path)
+        if error:
+            return error
+        if watch == True and len(roots) > 1:
+            return 'Watch mode searches a single path.'
+        if watch == True and not (name, hasdoc, pathglob, newer, older, limit) == (None,) * 6:
+            return 'Watch mode lists every file, without filters.'
+        path = roots[0] if watch == True else roots
 
-    tab = '    '
-    docIndent = '\n' + tab*3
-    rx = re.compile('^\s*((def|class)\s*([a-zA-Z0-9_]+)\s*(\([a-zA-Z0-9_\,\ \=\'\"\*\.]*\))*):[\s]*(\"\"\"([\S\s]*?)\"\"\")*', re.MULTILINE)
-    #rx = re.compile('^\s*((def|class)\s*(([^ (:]+)[\s]*([(][^:]+[\)])*)):[\s]*(\"\"\"([\S\s]*?)\"\"\")*', re.MULTILINE)
-    out = ''
-    lines = []
-    for root, dirs, files in walk(path):
-        pyfiles = []
-        for f in files:
-            if splitext(join(root, f))[1] == '.py' and not f == '__init__.py':
-                pyfiles.append(f)
-        if len(pyfiles)>0:
-            lines.append(pathcolor(root))
-            for f in pyfiles:
-                lines.append(tab + filecolor(f))
-                if links == True:
-                    lines.append(tab*2 + linkcolor('file://' + re.sub(' ', r'\ ', join(root, f))))
-                if modified == True:
-                    lines.append(tab*2 + timestampcolor('Modified: ' + str(ctime(stat(join(root, f)).st_mtime))))
-                if classes == True or functioncolors == True:
-                    with open(join(root, f), "rt") as file:
-                        t = file.read()
-                    for d in rx.findall(t):
-                        if d[1] == 'class' and classes == True:
-                            lines.append(tab*2 + keywordcolor(d[1].strip()) + ' ' + \
-                            functioncolor(d[2].strip()) + arglistcolor(d[3].strip()))
-                            if docs == True and not d[5] == '':
-                                [lines.append(tab*3 + commentcolor(s.strip())) for s in d[5].split('\n')]
-                        if d[1] == 'def' and functions == True:
-                            lines.append(tab*2 + functioncolor(d[2].strip()) + arglistcolor(d[3].strip()))
-                            if docs == True and not d[5] == '':
-                                [lines.append(tab*3 + commentcolor(s.strip())) for s in d[5].split('\n')]
-        if skipdir in dirs:
-            dirs.remove(skipdir)
-
-    print(setbackground + '\n' + '\n'.join(lines) + clearbackground)
+    if not engine in engines:
+        return 'Unknown engine: {}'.format(engine)
+    if not format in formats:
+        return 'Unknown format: {}'.format(format)
+    if not format == 'text' and watch == True:
+        return 'Watch mode writes text.'
+    if format == 'sqlite' and saveas == None:
+        return 'sqlite output needs a saveas path.'
+    if not limit == None and not (type(limit) == int and limit > 0):
+        return 'limit must be a positive number.'
+    if not page == None and (limit == None or not (type(page) == int and page > 0)):
+        return 'page must be a positive number, with a limit.'
+    renderer = Renderer(links, modified, docs, colormode, scheme)
+    tab = renderer.tab
+    printstats = stats == True or (type(stats) == int and stats > 0)
+    if printstats or (hook and not stats):
+        stats = Stats(stats if type(stats) == int else 10)
+    if stats and hook:
+        stats.hook = hook
+
+    def refresh(watcher, changed, removed):
+        """refresh(watcher, changed, removed)
+        print the entries of changed files and rewrite saveas
+        """
+        renderer.emit(watcher.records(set(changed), docs), [sys.stdout])
+        print()
+        if removed:
+            print(renderer.setbackground + '\n'.join(tab + renderer.timestampcolor('Removed: ' + f) for f in removed) + \
+                renderer.clearbackground)
+        if not saveas == None:
+            with open(saveas + '.tmp', 'wt') as out:
+                renderer.emit(watcher.records(docs=docs), [out])
+            replace(saveas + '.tmp', saveas)
+
+    if index == True:
+        index = SymbolIndex(None, rebuild, verify)
+    elif index:
+        index = SymbolIndex(index, rebuild, verify)
+
+    # with jsonl on stdout the reports go to stderr, to keep the output clean
+    report = sys.stderr if format == 'jsonl' and saveas == None else sys.stdout
+    try:
+        out = None
+        if not saveas == None and not format == 'sqlite':
+            out = open(saveas, 'wt', encoding='utf-8' if format == 'jsonl' else None)
+        try:
+            if watch == True:
+                watcher = Watcher(path, refresh, classes, functions, skipdir, index, workers, engine,
+                    exclude, gitignore, maxdepth, followlinks, maxsize, truncate)
+                records = watcher.records(docs=docs)
+            else:
+                records = iter_modsearch(path, classes, functions, skipdir, index, rebuild, verify, workers, engine,
+                    exclude, gitignore, maxdepth, followlinks, maxsize, truncate, environment, stats or None, dedupe,
+                    docs, name, hasdoc, pathglob, newer, older)
+                if limit:
+                    search = records
+                    start = limit * ((page or 1) - 1)
+                    records = islice(search, start, start + limit)
+            if format == 'sqlite':
+                writesqlite(records, saveas, docs, stats or None)
+            elif format == 'jsonl':
+                writejsonl(records, out or sys.stdout, docs, stats or None)
+            else:
+                renderer.emit(records, [sys.stdout, out] if out else [sys.stdout], stats or None)
+                print()
+            if limit:
+                # one more record tells whether there is another page, then the search can stop
+                more = not next(search, None) == None
+                search.close()
+        finally:
+            if out:
+                out.close()
+        if limit and more:
+            print('showing {} records, page {} has more'.format(limit, (page or 1) + 1), file=report)
+        if not saveas == None:
+            print('output saved to:', saveas, file=report)
+        if index:
+            print(index.report(), file=report)
+        if printstats:
+            print(stats.report(), file=report)
+        if watch == True:
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        if index:
+            index.close()
+
+Hit = namedtuple('Hit', 'score kind name arglist path line')
+Hit.__doc__ = """Hit(score, kind, name, arglist, path, line)
+one ranked result from QueryIndex.search() or query()
+"""
+
+_wordrx = re.compile('[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+
+def terms(s):
+    """terms(string)
+    split a name or some text into lowercase search terms,
+    snake_case and CamelCase are split into their words
+    """
+    return [w.lower() for w in _wordrx.findall(s)]
+
+def _within1(a, b):
+    """_within1(a, b)
+    True if the strings are at most one edit or one swap apart
+    """
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or a[i + 1:i + 2] + a[i:i + 1] == b[i:i + 2] and a[i + 2:] == b[i + 2:]
+    return a[i:] == b[i + 1:]
+
+_idmask = (1 << 32) - 1
+
+def _has(postings, key):
+    """_has(postings, key)
+    True if the sorted postings hold key
+    """
+    i = bisect_left(postings, key)
+    return i < len(postings) and postings[i] == key
+
+class QueryIndex:
+    """QueryIndex()
+    in-memory inverted index over class and function names and their
+    heredocs. names are split into snake_case and CamelCase words, so
+    'parse config' finds parse_config, ConfigParser and parseConfig.
+    build it with add() or from_search(), look things up with search()
+    and keep it between sessions with save() and load(). a changed
+    file is updated with remove() and add() of its new Records.
+    symbols are kept as Symbols, with their file paths stored once,
+    removed ones are None until there are enough to compact.
+    postings hold len(name) << 32 | symbol number, sorted, so they
+    are in the order search() breaks ties in and it can stop early.
+    """
+
+    def __init__(self):
+        self.symbols = []
+        self.paths = []
+        self.fileids = {}
+        self.byfile = {}
+        self.names = {}
+        self.docs = {}
+        self.removed = 0
+        self._unsorted = {}
+        self._vocabulary = None
+        self._deletes = None
+
+    def add(self, record):
+        """add(record)
+        index a class or def Record, other records are ignored
+        """
+        if not record.kind in ('class', 'def'):
+            return
+        n = len(self.symbols)
+        fileid = self.fileids.get(record.path)
+        if fileid == None:
+            fileid = self.fileids[record.path] = len(self.paths)
+            self.paths.append(record.path)
+        self.symbols.append(Symbol(fileid, record.kind, record.name, record.arglist, record.line, record.depth))
+        self.byfile.setdefault(fileid, []).append(n)
+        key = len(record.name) << 32 | n
+        for table, words in ((self.names, terms(record.name) + [record.name.lower()]),
+            (self.docs, terms(record.heredoc))):
+            for term in set(words):
+                postings = table.get(term)
+                if postings == None:
+                    table[term] = [key]
+                    continue
+                if key < postings[-1]:
+                    # sorted before the next search
+                    self._unsorted[id(postings)] = postings
+                postings.append(key)
+        self._vocabulary = self._deletes = None
+
+    def remove(self, path):
+        """remove(path)
+        forget the symbols of one file, their postings are dropped
+        once removed symbols make up half the index
+        """
+        for n in self.byfile.pop(self.fileids.get(path), []):
+            self.symbols[n] = None
+            self.removed += 1
+        if self.removed * 2 > len(self.symbols):
+            self._compact()
+
+    def _compact(self):
+        """_compact()
+        drop removed symbols, renumbering the rest in the same order
+        so postings stay sorted
+        """
+        self._sort()
+        renumber = [-1] * len(self.symbols)
+        symbols = []
+        for n, symbol in enumerate(self.symbols):
+            if not symbol == None:
+                renumber[n] = len(symbols)
+                symbols.append(symbol)
+        for table in (self.names, self.docs):
+            for term, postings in list(table.items()):
+                postings = [key >> 32 << 32 | renumber[key & _idmask] for key in postings
+                    if renumber[key & _idmask] >= 0]
+                if postings:
+                    table[term] = postings
+                else:
+                    del table[term]
+        self.symbols = symbols
+        self.byfile = {}
+        for n, symbol in enumerate(symbols):
+            self.byfile.setdefault(symbol.fileid, []).append(n)
+        self.removed = 0
+        self._vocabulary = self._deletes = None
+
+    def _sort(self):
+        """_sort()
+        sort the postings added to out of order
+        """
+        for postings in self._unsorted.values():
+            postings.sort()
+        self._unsorted = {}
+
+    @classmethod
+    def from_search(cls, path=None, **options):
+        """QueryIndex.from_search(path=None, **options)
+        build an index from iter_modsearch(path, **options)
+        """
+        queryindex = cls()
+        for record in iter_modsearch(path, **options):
+            queryindex.add(record)
+        return queryindex
+
+    def _expand(self, term, prefix, fuzzy):
+        """_expand(term, prefix, fuzzy)
+        returns a list of (name term, weight) matching a query term,
+        exact matches weigh most, then prefixes, then one-edit typos
+        """
+        found = {term: 3.0} if term in self.names else {}
+        if prefix and len(term) > 1:
+            if self._vocabulary == None:
+                self._vocabulary = sorted(self.names)
+            i = bisect_left(self._vocabulary, term)
+            for other in self._vocabulary[i:i + 200]:
+                if not other.startswith(term):
+                    break
+                found.setdefault(other, 1.0 + len(term) / len(other))
+        if fuzzy and len(term) > 3:
+            if self._deletes == None:
+                self._deletes = {}
+                for other in self.names:
+                    for i in range(len(other)):
+                        self._deletes.setdefault(other[:i] + other[i + 1:], []).append(other)
+            candidates = set(self._deletes.get(term, []))
+            for i in range(len(term)):
+                candidates.add(term[:i] + term[i + 1:])
+                candidates.update(self._deletes.get(term[:i] + term[i + 1:], []))
+            for other in candidates:
+                if other in self.names and _within1(term, other):
+                    found.setdefault(other, 1.0)
+        return found.items()
+
+    def _lists(self, text, prefix, fuzzy):
+        """_lists(text, prefix, fuzzy)
+        returns the (weight, postings) of every name and heredoc term
+        a query matches, heaviest first, each symbol in postings scores
+        weight, rarer terms weigh more
+        """
+        lists = []
+        total = len(self.symbols) - self.removed + 1
+        for term in set(terms(text)):
+            for other, weight in self._expand(term, prefix, fuzzy):
+                postings = self.names[other]
+                lists.append((weight * (log(total / len(postings)) + 1), postings))
+            postings = self.docs.get(term)
+            if postings:
+                lists.append((log(total / (len(postings) + 1)) + 1, postings))
+        lists.sort(key=lambda l: -l[0])
+        return lists
+
+    def search(self, text, kind=None, limit=20, prefix=True, fuzzy=True, budget=4096):
+        """search(text, kind=None, limit=20, prefix=True, fuzzy=True, budget=4096)
+        returns up to limit Hits ranked by how well the words of text
+        match each symbol name and heredoc, rare words count for more.
+        kind       'class' or 'def' to only return one kind of symbol
+        prefix     boolean, let words match the start of longer words
+        fuzzy      boolean, let longer words match with one typo
+        budget     int, postings of lists up to this long are read
+                   whole, the eight longest over it are walked together
+                   in order and left as soon as nothing further on can
+                   make the top limit
+        """
+        if self._unsorted:
+            self._sort()
+        symbols = self.symbols
+        lists = self._lists(text, prefix, fuzzy)
+        # the top limit so far as a heap of (score, -key), the worst first
+        best = []
+
+        def offer(score, key):
+            symbol = symbols[key & _idmask]
+            if not symbol or (kind and not symbol.kind == kind):
+                return
+            if len(best) < limit:
+                heappush(best, (score, -key))
+            elif (score, -key) > best[0]:
+                heappushpop(best, (score, -key))
+
+        # all but the longest lists are read whole
+        longest = sorted(range(len(lists)), key=lambda i: -len(lists[i][1]))[:8]
+        small = set(range(len(lists))) - set(i for i in longest if len(lists[i][1]) > budget)
+        bigs = [l for i, l in enumerate(lists) if not i in small]
+        # what each set of the long lists adds up to, by bit mask, always summed in
+        # the same order so that symbols in the same lists tie exactly
+        sums = [0.0]
+        for weight, postings in bigs:
+            sums += [total + weight for total in sums]
+        every = len(sums) - 1
+        partial = {}
+        for i in sorted(small):
+            weight = lists[i][0]
+            get = partial.get
+            for key in lists[i][1]:
+                partial[key] = get(key, 0) + weight
+        # whole name matches are doubled, a match is as long as the text and keys start
+        # with the length, so they are a slice of the postings already in key order
+        whole = text.strip().lower().replace(' ', '_')
+        wholes = (whole, whole.replace('_', ''))
+        matches = []
+        for w in set(wholes):
+            postings = self.names.get(w, ())
+            matches += postings[bisect_left(postings, len(w) << 32):bisect_left(postings, len(w) + 1 << 32)]
+        matches.sort()
+
+        lengths = (len(whole), len(wholes[1]))
+
+        def iswhole(key):
+            if not (key >> 32) in lengths:
+                return False
+            symbol = symbols[key & _idmask]
+            return bool(symbol) and symbol.name.lower() in wholes
+
+        # those and the symbols of the short lists are scored best first, looking up the long lists
+        for double, candidates in ((True, sorted((key for key in matches if key in partial),
+            key=lambda key: -partial[key]) + [key for key in matches if not key in partial]), (False, partial)):
+            if not double:
+                candidates = sorted(candidates, key=lambda key: (-partial[key], key))
+            for key in candidates:
+                score = partial.get(key, 0)
+                if len(best) == limit and ((score + sums[every]) * (1 + double), -key) < best[0]:
+                    break
+                if not iswhole(key) == double:
+                    continue
+                mask = 0
+                for i, (weight, postings) in enumerate(bigs):
+                    if _has(postings, key):
+                        mask |= 1 << i
+                score += sums[mask]
+                if score:
+                    offer(score * 2 if double else score, key)
+        # the rest of the symbols are only in the long lists, read together a block of
+        # keys at a time. the lightest lists, which add up to less than the worst of
+        # best, are only looked up, as a symbol in nothing else can't get in
+        cursors = [0] * len(bigs)
+        ends = [len(postings) for weight, postings in bigs]
+        byweight = sorted(range(len(bigs)), key=lambda i: bigs[i][0])
+        essential, lookups, rest, threshold = byweight, [], 0, None
+        step = limit * 4
+        while bigs:
+            if len(best) == limit and not best[0][0] == threshold:
+                threshold = best[0][0]
+                essential, lookups, rest = [], [], 0
+                for i in byweight:
+                    if sums[rest | 1 << i] < threshold:
+                        lookups.insert(0, i)
+                        rest |= 1 << i
+                    else:
+                        essential.append(i)
+            heads = [(bigs[i][1][cursors[i]], i) for i in essential if cursors[i] < ends[i]]
+            if not heads:
+                break
+            low, first = min(heads)
+            if len(best) == limit:
+                left = 0
+                for i in range(len(bigs)):
+                    if cursors[i] < ends[i]:
+                        left |= 1 << i
+                # everything further on has a larger key, so it would lose a tie
+                if (sums[left], -low) < best[0]:
+                    break
+            high = bigs[first][1][min(cursors[first] + step, ends[first]) - 1] + 1
+            step = min(step * 2, 1 << 16)
+            found = {}
+            for i in essential:
+                bit = 1 << i
+                postings = bigs[i][1]
+                end = bisect_left(postings, high, cursors[i])
+                get = found.get
+                for key in postings[cursors[i]:end]:
+                    found[key] = get(key, 0) | bit
+                cursors[i] = end
+            full = len(best) == limit
+            for key, mask in found.items():
+                if full and (sums[mask | rest], -key) < best[0]:
+                    continue
+                if key in partial or iswhole(key):
+                    continue
+                # heaviest first, giving up once the lists left can't make up the difference
+                left = rest
+                for i in lookups:
+                    left ^= 1 << i
+                    if _has(bigs[i][1], key):
+                        mask |= 1 << i
+                    elif full and (sums[mask | left], -key) < best[0]:
+                        break
+                else:
+                    offer(sums[mask], key)
+        hits = []
+        for score, key in sorted(best, reverse=True):
+            s = symbols[-key & _idmask]
+            hits.append(Hit(round(score, 3), s.kind, s.name, s.arglist, self.paths[s.fileid], s.line))
+        return hits
+
+    def save(self, filepath):
+        """save(filepath)
+        write the index to a json file
+        """
+        if self.removed:
+            self._compact()
+        self._sort()
+        with open(expanduser(filepath), 'wt') as f:
+            json.dump({'version': 3, 'paths': self.paths, 'names': self.names, 'docs': self.docs,
+                'symbols': [(s.kind, s.name, s.arglist, s.fileid, s.line, s.depth) for s in self.symbols]}, f)
+
+    @classmethod
+    def load(cls, filepath):
+        """QueryIndex.load(filepath)
+        read an index written by save()
+        """
+        with open(expanduser(filepath), 'rt') as f:
+            data = json.load(f)
+        queryindex = cls()
+        if data.get('version', 1) < 2:
+            # version 1 kept (kind, name, arglist, path, line) for each symbol
+            for kind, name, arglist, path, line in data['symbols']:
+                queryindex.fileids.setdefault(path, len(queryindex.fileids))
+                queryindex.symbols.append(Symbol(queryindex.fileids[path], kind, name, arglist, line, 0))
+            queryindex.paths = list(queryindex.fileids)
+        else:
+            queryindex.paths = data['paths']
+            queryindex.fileids = dict((path, i) for i, path in enumerate(queryindex.paths))
+            queryindex.symbols = [Symbol(fileid, kind, name, arglist, line, depth)
+                for kind, name, arglist, fileid, line, depth in data['symbols']]
+        for n, symbol in enumerate(queryindex.symbols):
+            queryindex.byfile.setdefault(symbol.fileid, []).append(n)
+        queryindex.names = data['names']
+        queryindex.docs = data['docs']
+        if data.get('version', 1) < 3:
+            # postings were plain symbol numbers
+            lengths = [len(s.name) for s in queryindex.symbols]
+            for table in (queryindex.names, queryindex.docs):
+                for term, postings in table.items():
+                    table[term] = sorted(lengths[n] << 32 | n for n in postings)
+        return queryindex
+
+_queryindexes = {}
 
+def query(text, path=None, kind=None, limit=20, refresh=False, **options):
+    """query(text, path=None, kind=None, limit=20, refresh=False, **options)
+    ranked search of the classes and functions below path, e.g.
+    query('parse config', kind='def'). the QueryIndex for a path is
+    built on the first query and reused until refresh=True, other
+    options are passed to iter_modsearch, index=True makes the first
+    build cheap as well. returns a list of Hits.
+    """
+    path, error = _checkpath(path)
+    if error:
+        raise ValueError(error)
+    key = (path, repr(sorted(options.items())))
+    if refresh or not key in _queryindexes:
+        _queryindexes[key] = QueryIndex.from_search(path, **options)
+    return _queryindexes[key].search(text, kind, limit)
+
+Reference = namedtuple('Reference', 'kind name module path line')
+Reference.__doc__ = """Reference(kind, name, module, path, line)
+one use of a name from ReferenceIndex.references() or references(),
+kind is 'call', 'attr', 'import' or 'name', module is where an import
+is from
+"""
+
+class ReferenceIndex:
+    """ReferenceIndex()
+    reverse index from names to the places they are used, built from
+    the reference Records of iter_modsearch(refs=True) with add() or
+    from_search(). references() looks a name up, a dotted import
+    name is found by its last part too, and imports() gives the
+    import graph. keep it between sessions with save() and load().
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.fileids = {}
+        self.uses = {}
+        self.modules = {}
+
+    def add(self, record):
+        """add(record)
+        index a call, attr, import or name Record, other records are
+        ignored
+        """
+        if not record.kind in refkinds:
+            return
+        fileid = self.fileids.get(record.path)
+        if fileid == None:
+            fileid = self.fileids[record.path] = len(self.paths)
+            self.paths.append(record.path)
+        use = (record.kind, fileid, record.line, record.arglist)
+        self.uses.setdefault(record.name, []).append(use)
+        if record.kind == 'import':
+            last = record.name.rpartition('.')[2]
+            if last and not last == record.name:
+                self.uses.setdefault(last, []).append(use)
+            if record.name == record.arglist:
+                self.modules.setdefault(fileid, set()).add(record.arglist)
+
+    @classmethod
+    def from_search(cls, path=None, **options):
+        """ReferenceIndex.from_search(path=None, **options)
+        build an index from iter_modsearch(path, refs=True, **options)
+        """
+        referenceindex = cls()
+        for record in iter_modsearch(path, refs=True, **options):
+            referenceindex.add(record)
+        return referenceindex
+
+    def references(self, name, kind=None):
+        """references(name, kind=None)
+        returns the References to name in search order, kind is 'call',
+        'attr', 'import' or 'name' to only return one kind of use
+        """
+        return [Reference(k, name, module, self.paths[fileid], line) for k, fileid, line, module in
+            self.uses.get(name, []) if kind == None or k == kind]
+
+    def imports(self):
+        """imports()
+        the import graph, a dict of file path to the sorted names of
+        the modules it imports, relative ones keep their leading dots
+        """
+        return dict((self.paths[fileid], sorted(modules)) for fileid, modules in self.modules.items())
+
+    def save(self, filepath):
+        """save(filepath)
+        write the index to a json file
+        """
+        with open(expanduser(filepath), 'wt') as f:
+            json.dump({'version': 1, 'paths': self.paths, 'uses': self.uses,
+                'modules': [(fileid, sorted(modules)) for fileid, modules in self.modules.items()]}, f)
+
+    @classmethod
+    def load(cls, filepath):
+        """ReferenceIndex.load(filepath)
+        read an index written by save()
+        """
+        with open(expanduser(filepath), 'rt') as f:
+            data = json.load(f)
+        referenceindex = cls()
+        referenceindex.paths = data['paths']
+        referenceindex.fileids = dict((path, i) for i, path in enumerate(referenceindex.paths))
+        referenceindex.uses = dict((name, [tuple(use) for use in uses]) for name, uses in data['uses'].items())
+        referenceindex.modules = dict((fileid, set(modules)) for fileid, modules in data['modules'])
+        return referenceindex
+
+_referenceindexes = {}
+
+def _referenceindex(path, refresh, options):
+    """_referenceindex(path, refresh, options)
+    the ReferenceIndex of a path or list of them, built on first use
+    and kept
+    """
+    roots, error = _checkpaths(path)
+    if error:
+        raise ValueError(error)
+    key = (tuple(roots), repr(sorted(options.items())))
+    if refresh or not key in _referenceindexes:
+        _referenceindexes[key] = ReferenceIndex.from_search(roots, **options)
+    return _referenceindexes[key]
+
+def references(name, path=None, kind=None, refresh=False, **options):
+    """references(name, path=None, kind=None, refresh=False, **options)
+    where name is called, accessed as an attribute, imported or used
+    bare below path, e.g. references('parsefile'). the ReferenceIndex
+    for a path is built in one pass on the first call and reused
+    until refresh=True, other options are passed to iter_modsearch
+    and index=True keeps the references between runs. returns a list
+    of References
+    """
+    return _referenceindex(path, refresh, options).references(name, kind)
+
+def importgraph(path=None, refresh=False, **options):
+    """importgraph(path=None, refresh=False, **options)
+    the modules each file below path imports, as a dict of file path
+    to sorted module names, from the same index as references()
+    """
+    return _referenceindex(path, refresh, options).imports()
+
+Change = namedtuple('Change', 'change kind name path line old new')
+Change.__doc__ = """Change(change, kind, name, path, line, old, new)
+one difference from diffsnapshots() or apidiff(), change is 'added',
+'removed' or 'changed', name is the dotted name of the class or
+function, path is relative to the root, line is in the newer tree
+unless removed, old and new are the arglists before and after
+"""
+
+def _fingerprint(kind, arglist):
+    """_fingerprint(kind, arglist)
+    a short hash of a signature, whitespace doesn't count
+    """
+    return sha1((kind + ' ' + ''.join(arglist.split())).encode()).hexdigest()[:16]
+
+def _snapsymbols(found):
+    """_snapsymbols(found)
+    turns parsetext() results into [kind, dotted name, arglist, line,
+    fingerprint] lists, names are qualified by depth and a repeated
+    name gets #2, #3 and so on
+    """
+    symbols, scope, seen = [], [], {}
+    for kind, name, arglist, heredoc, line, depth in found:
+        if not kind in ('class', 'def'):
+            continue
+        scope[depth:] = [name]
+        qualname = '.'.join(scope)
+        seen[qualname] = seen.get(qualname, 0) + 1
+        if seen[qualname] > 1:
+            qualname += '#{}'.format(seen[qualname])
+        symbols.append([kind, qualname, arglist, line, _fingerprint(kind, arglist)])
+    return symbols
+
+class Snapshot:
+    """Snapshot(root, engine='ast')
+    the classes and functions of a tree with their signatures, for
+    comparing versions with diffsnapshots(). files maps each path,
+    relative to root, to [mtime_ns, size, sha1, symbols], symbols are
+    [kind, dotted name, arglist, line, fingerprint] lists. take() makes
+    one and save() and load() keep it as json, with a previous
+    snapshot of the same root only changed files are read.
+    """
+
+    def __init__(self, root, engine='ast'):
+        self.root = root
+        self.engine = engine
+        self.files = {}
+
+    @classmethod
+    def take(cls, path=None, previous=None, engine='ast', workers=1, skipdir='', exclude=None, gitignore=False,
+        maxdepth=None, followlinks=False, maxsize=None, truncate=False):
+        """Snapshot.take(path=None, previous=None, engine='ast', workers=1, skipdir='', exclude=None,
+        gitignore=False, maxdepth=None, followlinks=False, maxsize=None, truncate=False)
+        snapshot the tree at path. files with the mtime and size they
+        have in previous, a Snapshot of the same root and engine, are
+        taken from it without being read. the ast engine is the
+        default as it qualifies methods with their classes
+        """
+        path, error = _checkpath(path)
+        if error:
+            raise ValueError(error)
+        if not engine in engines:
+            raise ValueError('Unknown engine: {}'.format(engine))
+        snap = cls(path, engine)
+        if previous and not (previous.root == path and previous.engine == engine):
+            previous = None
+        todo = []
+        for root, entries in walktree(path, skipdir, exclude, gitignore, maxdepth, followlinks):
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                name = relpath(entry.path, path).replace(sep, '/')
+                old = previous.files.get(name) if previous else None
+                if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+                    snap.files[name] = old
+                else:
+                    todo.append((name, entry.path, st))
+        results = parseall([filepath for name, filepath, st in todo], workers, True, engine, False, maxsize, truncate)
+        for (name, filepath, st), result in zip(todo, results):
+            if isinstance(result, SourceError):
+                snap.files[name] = [st.st_mtime_ns, st.st_size, None, []]
+            else:
+                snap.files[name] = [st.st_mtime_ns, st.st_size, result[0], _snapsymbols(result[1])]
+        return snap
+
+    def save(self, filepath):
+        """save(filepath)
+        write the snapshot to a json file
+        """
+        with open(expanduser(filepath), 'wt') as f:
+            json.dump({'version': 1, 'root': self.root, 'engine': self.engine, 'files': self.files}, f)
+
+    @classmethod
+    def load(cls, filepath):
+        """Snapshot.load(filepath)
+        read a snapshot written by save()
+        """
+        with open(expanduser(filepath), 'rt') as f:
+            data = json.load(f)
+        snap = cls(data['root'], data['engine'])
+        snap.files = data['files']
+        return snap
+
+def snapshot(path=None, saveas=None, **options):
+    """snapshot(path=None, saveas=None, **options)
+    take a Snapshot of path and return it, with saveas it is written
+    there too, and a snapshot already there is used as the previous
+    one, so only files changed since are read. the options are those
+    of Snapshot.take()
+    """
+    if not saveas == None and not 'previous' in options and exists(expanduser(saveas)):
+        try:
+            options['previous'] = Snapshot.load(saveas)
+        except (ValueError, KeyError):
+            pass
+    snap = Snapshot.take(path, **options)
     if not saveas == None:
-        with open(saveas, 'wt') as f:
-            f.write(setbackground + '\n' + '\n'.join(lines) + clearbackground)
-        print('output saved to:', saveas)
+        snap.save(saveas + '.tmp')
+        replace(expanduser(saveas + '.tmp'), expanduser(saveas))
+    return snap
+
+def diffsnapshots(old, new):
+    """diffsnapshots(old, new)
+    returns the Changes from one Snapshot to another, by path and
+    then dotted name. files with the same hash in both are skipped
+    without looking at their symbols, so the work follows the size
+    of the change. a signature counts as changed when its fingerprint
+    differs, moving within the file doesn't count. raises ValueError
+    if they were taken with different engines
+    """
+    if not old.engine == new.engine:
+        raise ValueError('Snapshots taken with different engines: {} and {}'.format(old.engine, new.engine))
+    changes = []
+    for name in sorted(set(old.files) | set(new.files)):
+        before, after = old.files.get(name), new.files.get(name)
+        if before and after and before[2] and before[2] == after[2]:
+            continue
+        before = dict((s[1], s) for s in before[3]) if before else {}
+        after = dict((s[1], s) for s in after[3]) if after else {}
+        for qualname in sorted(set(before) | set(after)):
+            a, b = before.get(qualname), after.get(qualname)
+            if a and b and a[0] == b[0]:
+                if not a[4] == b[4]:
+                    changes.append(Change('changed', b[0], qualname, name, b[3], a[2], b[2]))
+                continue
+            if a:
+                changes.append(Change('removed', a[0], qualname, name, a[3], a[2], ''))
+            if b:
+                changes.append(Change('added', b[0], qualname, name, b[3], '', b[2]))
+    return changes
+
+def apidiff(old, new, **options):
+    """apidiff(old, new, **options)
+    the Changes between two versions, each a Snapshot, a snapshot
+    file written by snapshot() or Snapshot.save(), or a directory to
+    snapshot with the options of Snapshot.take()
+    """
+    snaps = []
+    for version in (old, new):
+        if isinstance(version, str) and isfile(expanduser(version)):
+            version = Snapshot.load(version)
+        elif not isinstance(version, Snapshot):
+            version = Snapshot.take(version, **options)
+        snaps.append(version)
+    return diffsnapshots(*snaps)
+
+class _Tree:
+    """_Tree(path, options)
+    a Watcher running in the background for the daemon, with a
+    QueryIndex built on the first query and updated file by file
+    as they change, under the watcher's lock
+    """
+
+    def __init__(self, path, options):
+        self.watcher = Watcher(path, self.changed, **options)
+        self.queryindex = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self.watcher.run, args=(lambda: self.stopped,), daemon=True)
+        self.thread.start()
+
+    def changed(self, watcher, changed, removed):
+        """changed(watcher, changed, removed)
+        Watcher callback, update the QueryIndex for the changed files
+        """
+        with watcher.lock:
+            queryindex = self.queryindex
+            if queryindex == None:
+                return
+            for filepath in chain(removed, changed):
+                queryindex.remove(filepath)
+            for record in watcher.records(set(changed)):
+                queryindex.add(record)
+
+    def records(self):
+        """records()
+        returns the current Records as a list
+        """
+        with self.watcher.lock:
+            return list(self.watcher.records())
+
+    def search(self, text, kind=None, limit=20):
+        """search(text, kind=None, limit=20)
+        QueryIndex.search() over the current state
+        """
+        with self.watcher.lock:
+            if self.queryindex == None:
+                queryindex = QueryIndex()
+                for record in self.watcher.records():
+                    queryindex.add(record)
+                self.queryindex = queryindex
+            return self.queryindex.search(text, kind, limit)
+
+def serve(socketpath=None, workers=1):
+    """serve(socketpath=None, workers=1)
+    run a resident daemon which keeps the parsed trees in memory and
+    answers requests on a unix socket, see modclient.py for a client.
+    every request and reply is one line of json:
+    {"op": "list", "path": path, "options": {...}}   -> {"ok": true, "records": [...]}
+    {"op": "query", "path": path, "text": text, "kind": null,
+        "limit": 20, "options": {...}}               -> {"ok": true, "hits": [...]}
+    {"op": "ping"}                                   -> {"ok": true, "pid": pid, "trees": [...]}
+    {"op": "stop"}                                   -> {"ok": true}
+    options are the Watcher options, each distinct path and options
+    pair is walked once, then kept up to date by a Watcher.
+    failures reply {"ok": false, "error": message}
+    """
+    socketpath = expanduser(socketpath or defaultsocket)
+    if dirname(socketpath):
+        makedirs(dirname(socketpath), exist_ok=True)
+    if exists(socketpath):
+        try:
+            with socket.socket(socket.AF_UNIX) as s:
+                s.connect(socketpath)
+            raise OSError('a daemon is already listening on ' + socketpath)
+        except ConnectionRefusedError:
+            unlink(socketpath)
+    trees = {}
+    lock = threading.Lock()
+
+    def tree(message):
+        """tree(message)
+        returns the _Tree for the path and options of a request
+        """
+        path, error = _checkpath(message.get('path'))
+        if error:
+            raise ValueError(error)
+        options = dict(message.get('options') or {})
+        options.setdefault('workers', workers)
+        key = (path, json.dumps(options, sort_keys=True))
+        with lock:
+            if not key in trees:
+                trees[key] = _Tree(path, options)
+            return trees[key]
+
+    def answer(message):
+        """answer(message)
+        returns the reply to one request
+        """
+        op = message.get('op')
+        if op == 'ping':
+            return {'ok': True, 'pid': getpid(), 'trees': sorted(set(key[0] for key in trees))}
+        if op == 'list':
+            return {'ok': True, 'records': tree(message).records()}
+        if op == 'query':
+            hits = tree(message).search(message.get('text', ''), message.get('kind'), message.get('limit', 20))
+            return {'ok': True, 'hits': hits}
+        if op == 'stop':
+            threading.Thread(target=server.shutdown).start()
+            return {'ok': True}
+        raise ValueError('Unknown op: {}'.format(op))
+
+    class Handler(socketserver.StreamRequestHandler):
+        """Handler
+        reads requests from one connection until it closes
+        """
+
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    reply = answer(json.loads(line))
+                except Exception as e:
+                    reply = {'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)}
+                self.wfile.write((json.dumps(reply) + '\n').encode())
+                self.wfile.flush()
+
+    server = socketserver.ThreadingUnixStreamServer(socketpath, Handler)
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for t in trees.values():
+            t.stopped = True
+        if exists(socketpath):
+            unlink(socketpath)
+
+def _when(s):
+    """_when(string)
+    seconds since the epoch from a number or an ISO date and time
+    """
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(s).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError('not a date or a number of seconds: {}'.format(s))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='list python files with their classes, functions and heredocs')
+    parser.add_argument('path', nargs='*', default=None, help='directories to search, defaults to the current one')
+    parser.add_argument('--no-links', dest='links', action='store_false', help="don't show links to files")
+    parser.add_argument('--no-modified', dest='modified', action='store_false', help="don't show modified times")
+    parser.add_argument('--no-classes', dest='classes', action='store_false', help="don't show classes")
+    parser.add_argument('--no-functions', dest='functions', action='store_false', help="don't show functions")
+    parser.add_argument('--no-docs', dest='docs', action='store_false', help="don't show heredocs")
+    parser.add_argument('--saveas', help='file path for a copy of the output')
+    parser.add_argument('--format', default='text', choices=formats,
+        help='text, a line of json per record, or a sqlite database at --saveas')
+    parser.add_argument('--colormode', default='trucolor', help='none, 256 or trucolor')
+    parser.add_argument('--scheme', default='deepblue', help='deepblue, chocolate or bright')
+    parser.add_argument('--skipdir', default='', help='directory name to skip')
+    parser.add_argument('--exclude', action='append', help='gitignore style pattern to skip, can be repeated')
+    parser.add_argument('--gitignore', action='store_true', help='skip anything matched by .gitignore files')
+    parser.add_argument('--maxdepth', type=int, help='how many directory levels to search')
+    parser.add_argument('--followlinks', action='store_true', help='search symlinked directories')
+    parser.add_argument('--name', help='only list classes and functions matching this pattern, e.g. parse*')
+    parser.add_argument('--hasdoc', action='store_const', const=True, help='only those with a heredoc')
+    parser.add_argument('--nodoc', dest='hasdoc', action='store_const', const=False, help='only those without one')
+    parser.add_argument('--pathglob', help='only search files whose paths match this pattern')
+    parser.add_argument('--newer', type=_when, help='only search files modified since, a date or epoch seconds')
+    parser.add_argument('--older', type=_when, help='only search files modified before, a date or epoch seconds')
+    parser.add_argument('--limit', type=int, help='stop after this many records')
+    parser.add_argument('--page', type=int, help='with --limit, which page of records to show')
+    parser.add_argument('--maxsize', type=int, help='skip files over this many bytes')
+    parser.add_argument('--truncate', action='store_true', help='parse the start of files over --maxsize')
+    parser.add_argument('--environment', action='store_const', const=True, help='search sys.path')
+    parser.add_argument('--environment-path', metavar='PATH',
+        help='search the sys.path of a virtualenv or python executable')
+    parser.add_argument('--index', action='store_const', const=True, help='keep parsed files in a persistent index')
+    parser.add_argument('--index-file', metavar='PATH', help='keep the persistent index at PATH')
+    parser.add_argument('--rebuild', action='store_true', help='discard the indexed entries and reparse')
+    parser.add_argument('--verify', action='store_true', help='check indexed files against a content hash')
+    parser.add_argument('--workers', type=int, default=1, help='number of parsing processes, 0 for every core')
+    parser.add_argument('--engine', help='regex, ast or tokenize, the default is regex, or ast with --snapshot '
+        'and --diff')
+    parser.add_argument('--dedupe', action='store_const', const=True,
+        help='parse identical files once, the default with several paths')
+    parser.add_argument('--watch', action='store_true', help='keep running and print files as they change')
+    parser.add_argument('--profile', dest='stats', nargs='?', type=int, const=10, default=None,
+        help='print phase timings and counters, with the N slowest files (default 10)')
+    parser.add_argument('--references', metavar='NAME',
+        help='list where NAME is called, used as an attribute, imported or used bare')
+    parser.add_argument('--snapshot', metavar='FILE',
+        help='save a snapshot of the classes and functions of one path, only reading files changed since the last one')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'),
+        help='list the classes, functions and signatures changed between two snapshots or directories')
+    parser.add_argument('--serve', action='store_true', help='run the resident daemon, see modclient.py')
+    parser.add_argument('--socket', help='unix socket path for --serve')
+    args = vars(parser.parse_args())
+    args['workers'] = args['workers'] or None
+    args['path'] = args['path'] or None
+    args['environment'] = args.pop('environment_path') or args['environment']
+    args['index'] = args.pop('index_file') or args['index']
+    if args['engine'] == None:
+        # left to each function's own default
+        del args['engine']
+    if args.pop('serve'):
+        serve(args['socket'], args['workers'])
+        sys.exit()
+    del args['socket']
+    saveas, versions = args.pop('snapshot'), args.pop('diff')
+    if saveas and args['path'] and len(args['path']) > 1:
+        parser.error('--snapshot takes one path')
+    if saveas or versions:
+        options = dict((k, args[k]) for k in ('skipdir', 'workers', 'engine', 'exclude', 'gitignore', 'maxdepth',
+            'followlinks', 'maxsize', 'truncate') if k in args)
+        try:
+            if saveas:
+                snap = snapshot(args['path'][0] if args['path'] else None, saveas, **options)
+                print(len(snap.files), 'files in snapshot', saveas)
+            else:
+                for change in apidiff(versions[0], versions[1], **options):
+                    if args['format'] == 'jsonl':
+                        print(json.dumps(change._asdict()))
+                    elif change.change == 'changed':
+                        print('changed {} {} {} -> {}  {}:{}'.format(change.kind, change.name, change.old, change.new,
+                            change.path, change.line))
+                    else:
+                        print('{} {} {}{}  {}:{}'.format(change.change, change.kind, change.name,
+                            change.old or change.new, change.path, change.line))
+        except ValueError as e:
+            sys.exit(str(e))
+        sys.exit()
+    name = args.pop('references')
+    if name:
+        options = dict((k, args[k]) for k in ('skipdir', 'index', 'workers', 'engine', 'exclude', 'gitignore',
+            'maxdepth', 'followlinks', 'maxsize', 'truncate', 'pathglob', 'newer', 'older') if k in args)
+        try:
+            for ref in references(name, args['path'], **options):
+                source = ' from ' + ref.module if ref.module and not ref.module == ref.name else ''
+                print('{}:{}: {} {}{}'.format(ref.path, ref.line, ref.kind, ref.name, source))
+        except ValueError as e:
+            sys.exit(str(e))
+        sys.exit()
+    error = modsearch(**args)
+    if error:
+        sys.exit(error)